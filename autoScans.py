@@ -3,17 +3,33 @@ import typing
 import csv
 import os
 import json
-from copy import deepcopy
-from functools import cache
 import psycopg
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import urllib.parse
+try:
+    from requests_toolbelt import MultipartEncoder
+except ImportError:  # Optional: without it upload bodies are built in memory
+    MultipartEncoder = None
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the standard json module
+    orjson = None
 from psycopg.rows import dict_row
 import time
-import random
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 import threading
+import itertools
+import random
+import collections
 import sys
 import io
+import logging
+import logging.handlers
+import queue
+import hashlib
+import tempfile
 from config import *
 
 # Fix Windows console encoding to support Unicode characters
@@ -21,121 +37,161 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
-def fetch_as_dict(cursor) -> typing.Tuple[typing.Dict[str, typing.Any], ...]:
-    return tuple(cursor.fetchall())
+logger = logging.getLogger(__name__)
 
-def retry_with_exponential_backoff(max_retries=3, base_delay=1, max_delay=60, backoff_factor=2):
-    """Decorator to retry functions with exponential backoff for 502/503 errors"""
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            last_exception = None
-            start_time = time.time()
-            max_total_time = 1800  # 30 minutes total timeout for large batches
-            
-            for attempt in range(max_retries + 1):
-                try:
-                    # Check if we've exceeded the total timeout
-                    if time.time() - start_time > max_total_time:
-                        print(f"[ERROR] Total timeout ({max_total_time}s) exceeded")
-                        raise TimeoutError("Total operation timeout exceeded")
-                    
-                    return func(*args, **kwargs)
-                except requests.exceptions.HTTPError as e:
-                    if e.response.status_code in [502, 503]:
-                        last_exception = e
-                        if attempt < max_retries:
-                            # Calculate delay with exponential backoff and jitter
-                            delay = min(base_delay * (backoff_factor ** attempt), max_delay)
-                            jitter = random.uniform(0, 0.1) * delay
-                            total_delay = delay + jitter
-                            
-                            print(f"[WARNING] HTTP {e.response.status_code} error on attempt {attempt + 1}/{max_retries + 1}")
-                            print(f"[RETRY] Retrying in {total_delay:.2f} seconds...")
-                            time.sleep(total_delay)
-                            continue
-                        else:
-                            print(f"[ERROR] Max retries ({max_retries}) exceeded for HTTP {e.response.status_code}")
-                            raise e
-                    else:
-                        # Re-raise non-502/503 HTTP errors immediately
-                        raise e
-                except requests.exceptions.Timeout as e:
-                    print(f"[ERROR] Request timeout on attempt {attempt + 1}/{max_retries + 1}")
-                    if attempt < max_retries:
-                        delay = min(base_delay * (backoff_factor ** attempt), max_delay)
-                        print(f"[RETRY] Retrying in {delay:.2f} seconds...")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        raise e
-                except Exception as e:
-                    # Re-raise non-HTTP errors immediately
-                    raise e
-            
-            # This should never be reached, but just in case
-            if last_exception:
-                raise last_exception
-                
-        return wrapper
-    return decorator
+BANNER = '=' * 80
 
-def download_file_threaded(file_id: int, instance_name: str, auth_token: str) -> tuple[int, tuple]:
-    """Thread-safe wrapper for download_file function"""
-    try:
-        result = download_file(file_id, instance_name=instance_name, auth_token=auth_token)
-        return file_id, result
-    except Exception as e:
-        print(f"[ERROR] [Thread] Error downloading file {file_id}: {e}")
-        raise
+def setup_logging() -> logging.handlers.QueueListener:
+    """Route log records through a queue to a single writer thread, so worker threads never wait on stdout.
+    Set LOG_LEVEL=DEBUG to also log per-scan progress, full scan payloads and API responses.
+    The caller stops the returned listener to flush remaining records on exit."""
+    log_queue = queue.SimpleQueue()
+    # QueueHandler formats the message before queueing it; the writer thread only prints it
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), handlers=[queue_handler])
+    listener.start()
+    return listener
+
+MAX_WORKERS = 32  # upper limit for each worker count setting
+
+def _env_workers(name: str, default: int) -> int:
+    """Worker count from an environment variable, between 1 and MAX_WORKERS"""
+    return max(1, min(int(os.environ.get(name, default)), MAX_WORKERS))
+
+# Concurrency per batch; raise these on high-latency links
+MAX_FILE_WORKERS = _env_workers('MAX_FILE_WORKERS', 20)  # file copies (download + upload)
+MAX_SCAN_WORKERS = _env_workers('MAX_SCAN_WORKERS', 15)  # scan creation
+BATCH_PIPELINE_DEPTH = 2  # batches processed side by side, sharing the workers above
+
+# Pooled HTTP sessions, one per instance, shared by all worker threads. File copies and scan creation
+# hit the target instance at the same time, and when source and target are the same instance a copy
+# can use two connections (download and upload), so the pool has room for all of them
+POOL_MAXSIZE = 2 * MAX_FILE_WORKERS + MAX_SCAN_WORKERS
+
+# File-copy concurrency adapts between batches, never exceeding MAX_FILE_WORKERS:
+# multiplicative decrease after a failing copy stage, additive increase after a clean one
+_file_workers = MAX_FILE_WORKERS
+_FILE_WORKERS_LOCK = threading.Lock()
+
+def current_file_workers() -> int:
+    """Number of concurrent file copies to use for the next copy stage"""
+    with _FILE_WORKERS_LOCK:
+        return _file_workers
+
+def record_copy_stage(copied: int, failed: int) -> None:
+    """Adjust file-copy concurrency from a finished copy stage: +2 workers (up to MAX_FILE_WORKERS) when
+    fewer than 5% of copies failed, halved when 20% or more failed, otherwise unchanged"""
+    global _file_workers
+    attempted = copied + failed
+    if not attempted:
+        return
+    with _FILE_WORKERS_LOCK:
+        previous = _file_workers
+        if failed < attempted * 0.05:
+            _file_workers = min(MAX_FILE_WORKERS, _file_workers + 2)
+        elif failed >= attempted * 0.2:
+            _file_workers = max(1, _file_workers // 2)
+        if _file_workers != previous:
+            logger.debug("[COPY] File workers %s -> %s (%s/%s copies failed)", previous, _file_workers, failed, attempted)
+
+_SESSIONS: dict[str, requests.Session] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+def _get_session(instance_name: str) -> requests.Session:
+    """Return the keep-alive session for an instance, creating it on first use"""
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(instance_name)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=16,
+                pool_maxsize=POOL_MAXSIZE,
+                # Should the pool ever run out, wait for a free connection rather than open one that is
+                # discarded afterwards with a "Connection pool is full" warning
+                pool_block=True,
+                # Connection errors, rate limiting (429) and gateway errors are retried inside urllib3,
+                # waiting as long as Retry-After asks; only the throttled request's worker backs off.
+                # POST is included because uploads and scan creation are safe to repeat on the server side;
+                # the final response is returned so raise_for_status() still reports it
+                max_retries=Retry(
+                    total=3,
+                    backoff_factor=2,
+                    status_forcelist=[429, 502, 503, 504],
+                    allowed_methods=frozenset({'GET', 'POST'}),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                ),
+            )
+            session.mount('https://', adapter)
+            _SESSIONS[instance_name] = session
+        return session
+
+def dump_json(data: typing.Any) -> bytes:
+    """Serialize a request payload to JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode('utf-8')
 
-def upload_file_threaded(file_id: int, file_info: tuple, instance_name: str, auth_token: str) -> tuple[int, str]:
-    """Thread-safe wrapper for upload_file function"""
+def load_json(content: bytes) -> typing.Any:
+    """Parse a JSON response body, with orjson when it is installed. Raises ValueError on invalid JSON."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def fetch_as_dict(cursor) -> typing.List[typing.Dict[str, typing.Any]]:
+    return cursor.fetchall()
+
+def copy_file_threaded(file_id: int, from_instance: str, from_auth_token: "AuthToken", to_instance: str, to_auth_token: "AuthToken") -> tuple[int, str]:
+    """Thread-safe wrapper for copy_file function"""
     try:
-        result = upload_file(
-            file_info=file_info,
-            instance_name=instance_name,
-            auth_token=auth_token,
-            file_type='image',
+        result = call_with_auth(
+            lambda from_token, to_token: copy_file(
+                file_id,
+                from_instance=from_instance,
+                from_auth_token=from_token,
+                to_instance=to_instance,
+                to_auth_token=to_token,
+            ),
+            from_auth_token,
+            to_auth_token,
         )
         return file_id, result
     except Exception as e:
-        print(f"[ERROR] [Thread] Error uploading file {file_id}: {e}")
+        logger.error("[ERROR] [Thread] Error copying file %s: %s", file_id, e)
         raise
 
-def create_scan_threaded(scan_data: dict, source_scan_id: int, instance_name: str, auth_token: str) -> tuple[int, str]:
+def create_scan_threaded(scan_data: dict, source_scan_id: int, instance_name: str, auth_token: "AuthToken") -> tuple[int, str]:
     """Thread-safe wrapper for create_scan function with better error handling"""
     try:
-        print(f"[THREAD] Creating target scan for source scan {source_scan_id}", flush=True)
-        result = create_scan(data=scan_data, instance_name=instance_name, auth_token=auth_token)
-        print(f"[THREAD] Successfully created target scan {result} for source scan {source_scan_id}", flush=True)
+        logger.debug("[THREAD] Creating target scan for source scan %s", source_scan_id)
+        result = call_with_auth(lambda token: create_scan(data=scan_data, instance_name=instance_name, auth_token=token), auth_token)
+        logger.debug("[THREAD] Successfully created target scan %s for source scan %s", result, source_scan_id)
         return source_scan_id, result
     except requests.exceptions.Timeout as e:
-        print(f"[ERROR] [Thread] Timeout creating scan for source {source_scan_id}: {e}", flush=True)
+        logger.error("[ERROR] [Thread] Timeout creating scan for source %s: %s", source_scan_id, e)
         raise
     except requests.exceptions.HTTPError as e:
-        print(f"[ERROR] [Thread] HTTP error creating scan for source {source_scan_id}: {e}", flush=True)
+        logger.error("[ERROR] [Thread] HTTP error creating scan for source %s: %s", source_scan_id, e)
         if e.response.status_code == 400:
-            print(f"[ERROR] [Thread] 400 Bad Request for source scan {source_scan_id}", flush=True)
-            try:
-                error_response = e.response.json()
-                print(f"[ERROR] [Thread] Error Response: {error_response}", flush=True)
-            except:
-                print(f"[ERROR] [Thread] Error Response Text: {e.response.text}", flush=True)
-            print(f"[ERROR] [Thread] Scan data that caused 400 error: {scan_data}", flush=True)
+            # create_scan has already logged the parsed error response
+            logger.error("[ERROR] [Thread] 400 Bad Request for source scan %s", source_scan_id)
+            logger.debug("[ERROR] [Thread] Scan data that caused 400 error: %s", scan_data)
         else:
-            print(f"[ERROR] [Thread] HTTP Status Code: {e.response.status_code}", flush=True)
+            logger.error("[ERROR] [Thread] HTTP Status Code: %s", e.response.status_code)
             try:
-                error_response = e.response.json()
-                print(f"[ERROR] [Thread] Error Response: {error_response}", flush=True)
-            except:
-                print(f"[ERROR] [Thread] Error Response Text: {e.response.text}", flush=True)
+                error_response = load_json(e.response.content)
+                logger.error("[ERROR] [Thread] Error Response: %s", error_response)
+            except ValueError:
+                logger.error("[ERROR] [Thread] Error Response Text: %s", e.response.text)
         raise
     except Exception as e:
-        print(f"[ERROR] [Thread] Unexpected error creating scan for source {source_scan_id}: {e}", flush=True)
-        print(f"[ERROR] [Thread] Scan data that failed: {scan_data}", flush=True)
+        logger.error("[ERROR] [Thread] Unexpected error creating scan for source %s: %s", source_scan_id, e)
+        logger.debug("[ERROR] [Thread] Scan data that failed: %s", scan_data)
         raise
 
-def run_sql(sql: str, *, instance_name: str, db_password: str) -> typing.Any:
+def run_sql(sql: str, params: typing.Optional[typing.Sequence] = None, *, instance_name: str, db_password: str) -> typing.Any:
     with psycopg.connect(
             user='proxyuser',
             password=db_password,
@@ -144,209 +200,617 @@ def run_sql(sql: str, *, instance_name: str, db_password: str) -> typing.Any:
             dbname=instance_name,
             row_factory=dict_row
     ) as connection:
-        with connection.cursor() as cursor:
-            cursor.execute(sql)
+        # Binary protocol avoids text-encoding the jsonb columns on the server and parsing them here
+        with connection.cursor(binary=True) as cursor:
+            cursor.execute(sql, params, prepare=True)
             return fetch_as_dict(cursor)
 
-@cache
+def stream_sql(sql: str, ids: typing.Iterable[int], *, instance_name: str, db_password: str, chunk_size: int = 100) -> typing.Iterator[dict]:
+    """Yield the rows of sql for ids, querying chunk_size IDs at a time in ascending ID order.
+    sql takes the list of IDs of one chunk as its only parameter.
+    The connection is in autocommit mode, so every chunk is read in its own short transaction and
+    none is held open while the rows are processed; the connection itself stays open, idle between
+    chunks, until the generator is exhausted or closed."""
+    ids = sorted(set(ids))
+    with psycopg.connect(
+            user='proxyuser',
+            password=db_password,
+            host=f'{instance_name}-maint.rebotics.net',
+            port='5432',
+            dbname=instance_name,
+            row_factory=dict_row,
+            autocommit=True
+    ) as connection:
+        with connection.cursor(binary=True) as cursor:
+            for chunk_start in range(0, len(ids), chunk_size):
+                cursor.execute(sql, (ids[chunk_start:chunk_start + chunk_size],), prepare=True)
+                yield from fetch_as_dict(cursor)
+
+def iter_batches(rows: typing.Iterable, batch_size: int) -> typing.Iterator[tuple[int, list]]:
+    """Yield (offset, rows) chunks of at most batch_size rows, reading rows lazily"""
+    rows = iter(rows)
+    batch_start = 0
+    while batch := list(itertools.islice(rows, batch_size)):
+        yield batch_start, batch
+        batch_start += len(batch)
+
+# Auth tokens keyed on (instance, username); the password is never part of the key
+TOKEN_TTL = 3500  # seconds
+_TOKENS: dict[tuple[str, str], tuple[tuple[str, str], float]] = {}
+_TOKENS_LOCK = threading.Lock()
+_TOKEN_KEY_LOCKS: dict[tuple[str, str], threading.Lock] = {}
+
+# Tokens are also kept on disk, one file per key (readable by the current user only), so runs started within
+# TOKEN_TTL of each other skip authentication. Set MATESTS_TOKEN_CACHE to an empty value to disable.
+TOKEN_CACHE_DIR = os.environ.get(
+    'MATESTS_TOKEN_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'matests', 'tokens'),
+)
+
+def _token_cache_path(instance_name: str, username: str) -> str:
+    """Cache file for one key; hashed so usernames never appear in file names"""
+    digest = hashlib.sha256(f"{instance_name}|{username}".encode()).hexdigest()
+    return os.path.join(TOKEN_CACHE_DIR, f"{digest}.json")
+
+def _load_cached_token(instance_name: str, username: str) -> typing.Optional[tuple[tuple[str, str], float]]:
+    """Read one unexpired token from the disk cache; a missing or unreadable file counts as no token"""
+    if not TOKEN_CACHE_DIR:
+        return None
+    try:
+        with open(_token_cache_path(instance_name, username), 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        if entry['exp'] <= time.time():
+            return None
+        return (entry['id'], entry['token']), entry['exp']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def _save_cached_token(instance_name: str, username: str, result: tuple[str, str], expires_at: float) -> None:
+    """Atomically replace the disk cache file for one key"""
+    if not TOKEN_CACHE_DIR:
+        return
+    tmp_path = None
+    try:
+        os.makedirs(TOKEN_CACHE_DIR, mode=0o700, exist_ok=True)
+        # mkstemp creates the file with 0600 permissions
+        fd, tmp_path = tempfile.mkstemp(dir=TOKEN_CACHE_DIR, prefix='.token-', suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'id': result[0], 'token': result[1], 'exp': expires_at}, f)
+        os.replace(tmp_path, _token_cache_path(instance_name, username))
+    except OSError as e:
+        logger.warning("[AUTH] [WARNING] Could not write token cache in %s: %s", TOKEN_CACHE_DIR, e)
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 def get_auth_token(instance_name: str, username: str, password: str) -> tuple[str, str]:
-    response = requests.post(f'https://{instance_name}.rebotics.net/api/v4/token-auth/', json={
+    """Return (user_id, token) for an instance, re-authenticating once the cached token is about to expire.
+    A per-key lock is held while authenticating, so concurrent callers for the same key share one
+    request while logins to different instances run in parallel."""
+    key = (instance_name, username)
+    with _TOKENS_LOCK:
+        key_lock = _TOKEN_KEY_LOCKS.setdefault(key, threading.Lock())
+    
+    with key_lock:
+        with _TOKENS_LOCK:
+            cached = _TOKENS.get(key)
+        if cached is None:
+            cached = _load_cached_token(instance_name, username)
+        if cached is not None and time.time() < cached[1] - 60:
+            with _TOKENS_LOCK:
+                _TOKENS[key] = cached
+            return cached[0]
+        result = _request_auth_token(instance_name, username, password)
+        expires_at = time.time() + TOKEN_TTL
+        with _TOKENS_LOCK:
+            _TOKENS[key] = (result, expires_at)
+        # Only this key's file is rewritten, so concurrent runs using other accounts never clobber each other
+        _save_cached_token(instance_name, username, result, expires_at)
+        return result
+
+def _request_auth_token(instance_name: str, username: str, password: str) -> tuple[str, str]:
+    response = _get_session(instance_name).post(f'https://{instance_name}.rebotics.net/api/v4/token-auth/', data=dump_json({
         'username': username,
         'password': password,
-    }, timeout=30)  # Add 30-second timeout
+    }), headers={'Content-Type': 'application/json'}, timeout=30)  # Add 30-second timeout
     response.raise_for_status()
-    raw_data = response.json()
+    raw_data = load_json(response.content)
     
     if raw_data is None:
-        print(f"[AUTH] [ERROR] API returned None response for token auth!", flush=True)
-        print(f"[AUTH] [ERROR] API URL: https://{instance_name}.rebotics.net/api/v4/token-auth/", flush=True)
-        print(f"[AUTH] [ERROR] Username: {username}", flush=True)
-        print(f"[AUTH] [ERROR] Response Status: {response.status_code}", flush=True)
-        print(f"[AUTH] [ERROR] Response Text: {response.text}", flush=True)
+        logger.error("[AUTH] [ERROR] API returned None response for token auth!")
+        logger.error("[AUTH] [ERROR] API URL: https://%s.rebotics.net/api/v4/token-auth/", instance_name)
+        logger.error("[AUTH] [ERROR] Username: %s", username)
+        logger.error("[AUTH] [ERROR] Response Status: %s", response.status_code)
+        logger.error("[AUTH] [ERROR] Response Text: %s", response.text)
         raise ValueError("API returned None response for token auth")
     
     if 'id' not in raw_data or 'token' not in raw_data:
-        print(f"[AUTH] [ERROR] API response missing required fields!", flush=True)
-        print(f"[AUTH] [ERROR] API URL: https://{instance_name}.rebotics.net/api/v4/token-auth/", flush=True)
-        print(f"[AUTH] [ERROR] Response: {raw_data}", flush=True)
+        logger.error("[AUTH] [ERROR] API response missing required fields!")
+        logger.error("[AUTH] [ERROR] API URL: https://%s.rebotics.net/api/v4/token-auth/", instance_name)
+        logger.error("[AUTH] [ERROR] Response: %s", raw_data)
         raise ValueError(f"API response missing required fields. Response: {raw_data}")
     
     return raw_data['id'], raw_data['token']
 
+def invalidate_auth_token(instance_name: str, username: str, token: str) -> None:
+    """Forget a token the API has rejected, in memory and on disk, so the next get_auth_token logs in again.
+    A token that has already been replaced is left alone, so many threads reporting the same
+    rejected token cause a single login."""
+    key = (instance_name, username)
+    with _TOKENS_LOCK:
+        key_lock = _TOKEN_KEY_LOCKS.setdefault(key, threading.Lock())
+    
+    with key_lock:
+        with _TOKENS_LOCK:
+            cached = _TOKENS.get(key)
+            if cached is not None and cached[0][1] == token:
+                del _TOKENS[key]
+        on_disk = _load_cached_token(instance_name, username)
+        if on_disk is not None and on_disk[0][1] == token:
+            try:
+                os.remove(_token_cache_path(instance_name, username))
+            except OSError:
+                pass
+
+class AuthToken:
+    """Token for one instance and user, shared by all worker threads of a run.
+    get() goes through get_auth_token, so the token is renewed shortly before TOKEN_TTL runs out;
+    refresh() replaces a token the API has rejected."""
+
+    def __init__(self, instance_name: str, username: str, password: str):
+        self.instance_name = instance_name
+        self._username = username
+        self._password = password
+
+    def get(self) -> str:
+        return get_auth_token(self.instance_name, self._username, self._password)[1]
+
+    def refresh(self, rejected: str) -> str:
+        invalidate_auth_token(self.instance_name, self._username, rejected)
+        return self.get()
+
+    def issued_for(self, response: requests.Response) -> bool:
+        """Whether a response came from this token's instance"""
+        return urllib.parse.urlsplit(response.url).hostname == f'{self.instance_name}.rebotics.net'
+
+def call_with_auth(fn: typing.Callable[..., typing.Any], *auth_tokens: AuthToken) -> typing.Any:
+    """Call fn with the current value of each token. If an instance answers 401, its token is
+    refreshed and fn is called once more."""
+    values = [auth_token.get() for auth_token in auth_tokens]
+    try:
+        return fn(*values)
+    except requests.exceptions.HTTPError as e:
+        if e.response is None or e.response.status_code != 401:
+            raise
+        rejected = [i for i, auth_token in enumerate(auth_tokens) if auth_token.issued_for(e.response)]
+        if not rejected:
+            raise
+        for i in rejected:
+            logger.warning("[AUTH] Token for %s was rejected, re-authenticating", auth_tokens[i].instance_name)
+            values[i] = auth_tokens[i].refresh(values[i])
+    return fn(*values)
+
 SQL_FOR_GETTING_INFO_ABOUT_SCANS = """
 SELECT
 "realograms_implementation_scan"."id",
 "realograms_implementation_scan"."provided_values",
-jsonb_build_array((
-  SELECT jsonb_build_object('file_id', U0."file_id", 'type', U0."file_type") AS "a"
+COALESCE("files"."scan_files", '[]'::jsonb) AS "scan_files"
+FROM "realograms_implementation_scan"
+LEFT JOIN LATERAL (
+  SELECT jsonb_agg(jsonb_build_object('file_id', U0."file_id", 'type', U0."file_type")) AS "scan_files"
   FROM "realograms_implementation_scanfile" U0
   WHERE U0."scan_id" = "realograms_implementation_scan"."id"
-)) AS "scan_files"
-FROM "realograms_implementation_scan"
-WHERE "realograms_implementation_scan"."id" IN ({});
+) "files" ON true
+WHERE "realograms_implementation_scan"."id" = ANY(%s)
+ORDER BY "realograms_implementation_scan"."id";
 """
 
-def get_info_about_scans(scan_ids: typing.Sequence[int], *, instance_name: str, db_password: str) -> tuple[dict]:
-    return run_sql(
-        SQL_FOR_GETTING_INFO_ABOUT_SCANS.format(','.join(map(str, scan_ids))),
+def get_info_about_scans(scan_ids: typing.Sequence[int], *, instance_name: str, db_password: str) -> typing.Iterator[dict]:
+    """Stream scan info rows ordered by scan ID, so batches are the same on every run"""
+    return stream_sql(
+        SQL_FOR_GETTING_INFO_ABOUT_SCANS,
+        scan_ids,
         instance_name=instance_name,
         db_password=db_password,
     )
 
-def download_file(file_id: int, *, instance_name: str, auth_token: str) -> tuple[str, bytes]:
-    response = requests.get(
+def get_file_meta(file_id: int, *, instance_name: str, auth_token: str) -> tuple[str, str]:
+    """Return (file_url, original_filename) for a file on the source instance"""
+    response = _get_session(instance_name).get(
         f'https://{instance_name}.rebotics.net/api/v1/master-data/file-upload/{file_id}/',
         headers={'Authorization': f'Token {auth_token}'},
         timeout=60  # Increased timeout for large file downloads
     )
     response.raise_for_status()
-    raw_data = response.json()
+    raw_data = load_json(response.content)
     
     if raw_data is None:
-        print(f"[DOWNLOAD] [ERROR] API returned None response for file {file_id}!", flush=True)
-        print(f"[DOWNLOAD] [ERROR] API URL: https://{instance_name}.rebotics.net/api/v1/master-data/file-upload/{file_id}/", flush=True)
-        print(f"[DOWNLOAD] [ERROR] Response Status: {response.status_code}", flush=True)
-        print(f"[DOWNLOAD] [ERROR] Response Text: {response.text}", flush=True)
+        logger.error("[DOWNLOAD] [ERROR] API returned None response for file %s!", file_id)
+        logger.error("[DOWNLOAD] [ERROR] API URL: https://%s.rebotics.net/api/v1/master-data/file-upload/%s/", instance_name, file_id)
+        logger.error("[DOWNLOAD] [ERROR] Response Status: %s", response.status_code)
+        logger.error("[DOWNLOAD] [ERROR] Response Text: %s", response.text)
         raise ValueError(f"API returned None response for file {file_id}")
     
     if 'file' not in raw_data or 'original_filename' not in raw_data:
-        print(f"[DOWNLOAD] [ERROR] API response missing required fields for file {file_id}!", flush=True)
-        print(f"[DOWNLOAD] [ERROR] API URL: https://{instance_name}.rebotics.net/api/v1/master-data/file-upload/{file_id}/", flush=True)
-        print(f"[DOWNLOAD] [ERROR] Response: {raw_data}", flush=True)
+        logger.error("[DOWNLOAD] [ERROR] API response missing required fields for file %s!", file_id)
+        logger.error("[DOWNLOAD] [ERROR] API URL: https://%s.rebotics.net/api/v1/master-data/file-upload/%s/", instance_name, file_id)
+        logger.error("[DOWNLOAD] [ERROR] Response: %s", raw_data)
         raise ValueError(f"API response missing required fields. Response: {raw_data}")
     
-    file_url, file_name = raw_data['file'], raw_data['original_filename']
+    return raw_data['file'], raw_data['original_filename']
 
-    response = requests.get(file_url, timeout=120)  # Increased timeout for actual file download
-    response.raise_for_status()
+# Files up to this size stay in memory while being copied; larger ones spill to a temp file on disk
+SPOOL_MAX_SIZE = 8 << 20
+COPY_CHUNK_SIZE = 1 << 20
+
+def fetch_file(file_url: str, *, instance_name: str) -> requests.Response:
+    """Open a streaming response for a file body. The caller is responsible for closing it."""
+    response = _get_session(instance_name).get(file_url, stream=True, timeout=120)  # Increased timeout for actual file download
+    try:
+        response.raise_for_status()
+    except Exception:
+        response.close()
+        raise
+    # Undo any transfer Content-Encoding so the raw stream yields the original bytes
+    response.raw.decode_content = True
+
+    return response
+
+class _SpoolReader:
+    """Read-only view of a spooled file for MultipartEncoder. It has no fileno(): the encoder would call
+    it to size the part, and that makes a SpooledTemporaryFile roll over to disk."""
+
+    def __init__(self, spool: typing.BinaryIO, size: int):
+        self._spool = spool
+        self._size = size
 
-    return file_name, response.content
+    @property
+    def len(self) -> int:
+        """Bytes left to read, which is how MultipartEncoder sizes a part"""
+        return self._size - self._spool.tell()
 
-@retry_with_exponential_backoff(max_retries=3, base_delay=2, max_delay=30)
-def upload_file(*, file_info: tuple, file_type: str, instance_name: str, auth_token: str) -> str:
-    response = requests.post(
+    def read(self, size: int = -1) -> bytes:
+        return self._spool.read(size)
+
+    def tell(self) -> int:
+        return self._spool.tell()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._spool.seek(offset, whence)
+
+class _RewindableMultipart:
+    """Streaming multipart body that urllib3 can rewind when it retries the upload.
+    MultipartEncoder itself cannot seek, so seek(0) rebuilds it with the same boundary."""
+
+    def __init__(self, fields: dict):
+        self._fields = fields
+        self._encoder = MultipartEncoder(fields=fields)
+        self.content_type = self._encoder.content_type
+        self.len = self._encoder.len
+        self._position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._encoder.read(size)
+        self._position += len(chunk)
+        return chunk
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("multipart body can only be rewound to the start")
+        for value in self._fields.values():
+            if isinstance(value, tuple):
+                value[1].seek(0)
+        self._encoder = MultipartEncoder(fields=self._fields, boundary=self._encoder.boundary_value)
+        self._position = 0
+        return 0
+
+def upload_file(*, file_name: str, file_stream: typing.BinaryIO, file_type: str, instance_name: str, auth_token: str) -> str:
+    # Rewind to the start of the body; the file may have just been written to
+    size = file_stream.seek(0, io.SEEK_END)
+    file_stream.seek(0)
+    headers = {'Authorization': f'Token {auth_token}'}
+    if MultipartEncoder is not None:
+        # Stream the multipart body in chunks instead of assembling it in memory
+        body = _RewindableMultipart({
+            'file': (file_name, _SpoolReader(file_stream, size), 'application/octet-stream'),
+            'input_type': file_type,
+        })
+        headers['Content-Type'] = body.content_type
+        request_kwargs = {'data': body}
+    else:
+        request_kwargs = {
+            'files': {'file': (file_name, file_stream, 'application/octet-stream')},
+            'data': {'input_type': file_type},
+        }
+    response = _get_session(instance_name).post(
         f'https://{instance_name}.rebotics.net/api/v4/processing/upload/',
-        files={'file': file_info},
-        data={'input_type': file_type},
-        headers={'Authorization': f'Token {auth_token}'},
-        timeout=120  # Increased timeout for large file uploads
+        headers=headers,
+        timeout=120,  # Increased timeout for large file uploads
+        **request_kwargs
     )
     response.raise_for_status()
 
-    response_data = response.json()
+    response_data = load_json(response.content)
     if response_data is None:
-        print(f"[UPLOAD] [ERROR] API returned None response!", flush=True)
-        print(f"[UPLOAD] [ERROR] API URL: https://{instance_name}.rebotics.net/api/v4/processing/upload/", flush=True)
-        print(f"[UPLOAD] [ERROR] File Info: {file_info[0] if file_info else 'None'}", flush=True)
-        print(f"[UPLOAD] [ERROR] Response Status: {response.status_code}", flush=True)
-        print(f"[UPLOAD] [ERROR] Response Text: {response.text}", flush=True)
+        logger.error("[UPLOAD] [ERROR] API returned None response!")
+        logger.error("[UPLOAD] [ERROR] API URL: https://%s.rebotics.net/api/v4/processing/upload/", instance_name)
+        logger.error("[UPLOAD] [ERROR] File Name: %s", file_name)
+        logger.error("[UPLOAD] [ERROR] Response Status: %s", response.status_code)
+        logger.error("[UPLOAD] [ERROR] Response Text: %s", response.text)
         raise ValueError("API returned None response")
     
     if 'id' not in response_data:
-        print(f"[UPLOAD] [ERROR] API response missing 'id' field!", flush=True)
-        print(f"[UPLOAD] [ERROR] API URL: https://{instance_name}.rebotics.net/api/v4/processing/upload/", flush=True)
-        print(f"[UPLOAD] [ERROR] Response: {response_data}", flush=True)
+        logger.error("[UPLOAD] [ERROR] API response missing 'id' field!")
+        logger.error("[UPLOAD] [ERROR] API URL: https://%s.rebotics.net/api/v4/processing/upload/", instance_name)
+        logger.error("[UPLOAD] [ERROR] Response: %s", response_data)
         raise ValueError(f"API response missing 'id' field. Response: {response_data}")
     
     return response_data['id']
 
-@retry_with_exponential_backoff(max_retries=3, base_delay=2, max_delay=30)
+# Upload IDs by (target instance, content digest), so identical files with different IDs are uploaded once
+_UPLOADS_BY_DIGEST: dict[tuple[str, bytes], str] = {}
+_UPLOADS_BY_DIGEST_LOCK = threading.Lock()
+
+def download_file(file_url: str, spool: typing.BinaryIO, *, instance_name: str) -> bytes:
+    """Download a file body into the given spool and return the digest of its content."""
+    digest = hashlib.blake2b(digest_size=16)
+    with fetch_file(file_url, instance_name=instance_name) as response:
+        while chunk := response.raw.read(COPY_CHUNK_SIZE):
+            digest.update(chunk)
+            spool.write(chunk)
+    return digest.digest()
+
+def copy_file(file_id: int, *, from_instance: str, from_auth_token: str, to_instance: str, to_auth_token: str) -> str:
+    """Copy a file from the source instance to the target instance and return the upload ID.
+    The body is spooled per file (in memory up to SPOOL_MAX_SIZE, on disk beyond that) and released
+    as soon as its upload finishes. Transient HTTP failures are retried by the session adapter.
+    A file whose content was already uploaded to the target in this run reuses that upload."""
+    file_url, file_name = get_file_meta(file_id, instance_name=from_instance, auth_token=from_auth_token)
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+        digest = download_file(file_url, spool, instance_name=from_instance)
+        with _UPLOADS_BY_DIGEST_LOCK:
+            upload_id = _UPLOADS_BY_DIGEST.get((to_instance, digest))
+        if upload_id is not None:
+            logger.debug("[COPY] File %s has the same content as upload %s, reusing it", file_id, upload_id)
+            return upload_id
+        upload_id = upload_file(
+            file_name=file_name,
+            file_stream=spool,
+            file_type='image',
+            instance_name=to_instance,
+            auth_token=to_auth_token,
+        )
+        with _UPLOADS_BY_DIGEST_LOCK:
+            _UPLOADS_BY_DIGEST[(to_instance, digest)] = upload_id
+        return upload_id
+
 def create_scan(data: dict, *, instance_name: str, auth_token: str) -> str:
-    # Log the data being sent to create the target scan
-    print(f"[CREATE_SCAN] Posting scan data to create target scan:", flush=True)
-    print(f"[CREATE_SCAN] Data keys: {list(data.keys())}", flush=True)
-    print(f"[CREATE_SCAN] Store: {data.get('store')}, Files: {data.get('files')}, Captured_at: {data.get('captured_at')}", flush=True)
+    # Payloads can be large, so they are only formatted when debug logging is on
+    logger.debug("[CREATE_SCAN] Posting scan data to create target scan: %s", data)
     
-    response = requests.post(
+    # Serialized once; urllib3 resends the same bytes if the request is retried
+    response = _get_session(instance_name).post(
         f'https://{instance_name}.rebotics.net/api/v4/processing/actions/',
-        headers={'Authorization': f'Token {auth_token}'},
-        json=data,
+        headers={'Authorization': f'Token {auth_token}', 'Content-Type': 'application/json'},
+        data=dump_json(data),
         timeout=60  # Increased timeout for large batches
     )
     
+    # Parse the body once; every check and log line below reuses it
+    try:
+        response_data = load_json(response.content)
+        response_is_json = True
+    except ValueError as e:
+        response_data = None
+        response_is_json = False
+        parse_error = e
+    
     # Check for 400 Bad Request and log detailed error before raising
     if response.status_code == 400:
-        try:
-            error_response = response.json()
-            print(f"[CREATE_SCAN] [ERROR] 400 Bad Request received:", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] Status Code: {response.status_code}", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] Response: {error_response}", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] Request Data that caused error: {data}", flush=True)
-        except:
-            print(f"[CREATE_SCAN] [ERROR] 400 Bad Request received:", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] Status Code: {response.status_code}", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] Response Text: {response.text}", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] Request Data that caused error: {data}", flush=True)
+        logger.error("[CREATE_SCAN] [ERROR] 400 Bad Request received:")
+        logger.error("[CREATE_SCAN] [ERROR] Status Code: %s", response.status_code)
+        if response_is_json:
+            logger.error("[CREATE_SCAN] [ERROR] Response: %s", response_data)
+        else:
+            logger.error("[CREATE_SCAN] [ERROR] Response Text: %s", response.text)
+        logger.debug("[CREATE_SCAN] [ERROR] Request Data that caused error: %s", data)
     
     response.raise_for_status()
     
-    # Safely parse response and check for None
+    # Check the parsed response for None
     try:
-        response_data = response.json()
+        if not response_is_json:
+            raise parse_error
         if response_data is None:
-            print(f"[CREATE_SCAN] [ERROR] API returned None response!", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] API URL: https://{instance_name}.rebotics.net/api/v4/processing/actions/", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] Payload sent: {data}", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] Response Status: {response.status_code}", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] Response Text: {response.text}", flush=True)
+            logger.error("[CREATE_SCAN] [ERROR] API returned None response!")
+            logger.error("[CREATE_SCAN] [ERROR] API URL: https://%s.rebotics.net/api/v4/processing/actions/", instance_name)
+            logger.debug("[CREATE_SCAN] [ERROR] Payload sent: %s", data)
+            logger.error("[CREATE_SCAN] [ERROR] Response Status: %s", response.status_code)
+            logger.error("[CREATE_SCAN] [ERROR] Response Text: %s", response.text)
             raise ValueError("API returned None response")
         
         if 'id' not in response_data:
-            print(f"[CREATE_SCAN] [ERROR] API response missing 'id' field!", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] API URL: https://{instance_name}.rebotics.net/api/v4/processing/actions/", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] Payload sent: {data}", flush=True)
-            print(f"[CREATE_SCAN] [ERROR] Response: {response_data}", flush=True)
+            logger.error("[CREATE_SCAN] [ERROR] API response missing 'id' field!")
+            logger.error("[CREATE_SCAN] [ERROR] API URL: https://%s.rebotics.net/api/v4/processing/actions/", instance_name)
+            logger.debug("[CREATE_SCAN] [ERROR] Payload sent: %s", data)
+            logger.error("[CREATE_SCAN] [ERROR] Response: %s", response_data)
             raise ValueError(f"API response missing 'id' field. Response: {response_data}")
         
         target_scan_id = response_data['id']
         
-        # Log the response from creating the target scan
-        print(f"[CREATE_SCAN] Target scan created successfully:", flush=True)
-        print(f"[CREATE_SCAN] Response: {response_data}", flush=True)
-        print(f"[CREATE_SCAN] Target Scan ID: {target_scan_id}", flush=True)
+        logger.debug("[CREATE_SCAN] Target scan %s created, response: %s", target_scan_id, response_data)
         
         return target_scan_id
     except (ValueError, KeyError, TypeError) as e:
-        print(f"[CREATE_SCAN] [ERROR] Error parsing API response: {e}", flush=True)
-        print(f"[CREATE_SCAN] [ERROR] API URL: https://{instance_name}.rebotics.net/api/v4/processing/actions/", flush=True)
-        print(f"[CREATE_SCAN] [ERROR] Payload sent: {data}", flush=True)
-        print(f"[CREATE_SCAN] [ERROR] Response Status: {response.status_code}", flush=True)
-        try:
-            print(f"[CREATE_SCAN] [ERROR] Response JSON: {response.json()}", flush=True)
-        except:
-            print(f"[CREATE_SCAN] [ERROR] Response Text: {response.text}", flush=True)
+        logger.error("[CREATE_SCAN] [ERROR] Error parsing API response: %s", e)
+        logger.error("[CREATE_SCAN] [ERROR] API URL: https://%s.rebotics.net/api/v4/processing/actions/", instance_name)
+        logger.debug("[CREATE_SCAN] [ERROR] Payload sent: %s", data)
+        logger.error("[CREATE_SCAN] [ERROR] Response Status: %s", response.status_code)
+        if response_is_json:
+            logger.error("[CREATE_SCAN] [ERROR] Response JSON: %s", response_data)
+        else:
+            logger.error("[CREATE_SCAN] [ERROR] Response Text: %s", response.text)
         raise
 
-def save_checkpoint(checkpoint_file: str, completed_batches: set, scan_mapping: list, failed_scans: int) -> None:
-    """Save progress checkpoint to file"""
+# The checkpoint is an append-only log: a snapshot line followed by one line per completed batch.
+# Every CHECKPOINT_COMPACT_EVERY batches the log is folded back into a single snapshot line
+CHECKPOINT_COMPACT_EVERY = 100
+
+def save_checkpoint(checkpoint_file: str, completed_batches: set, scan_mapping: list, failed_scans: int, csv_filename: str) -> None:
+    """Write a snapshot of the progress, replacing the checkpoint log atomically"""
     checkpoint_data = {
         'completed_batches': list(completed_batches),
         'scan_mapping': scan_mapping,
         'failed_scans': failed_scans,
+        'csv_filename': csv_filename,
         'timestamp': datetime.datetime.now().isoformat()
     }
+    tmp_path = None
     try:
-        with open(checkpoint_file, 'w', encoding='utf-8') as f:
-            json.dump(checkpoint_data, f, indent=2)
+        # A crash mid-write leaves the previous checkpoint in place instead of a truncated file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(checkpoint_file)), prefix='.checkpoint-', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(dump_json(checkpoint_data) + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, checkpoint_file)
     except Exception as e:
-        print(f"[WARNING] Failed to save checkpoint: {e}")
+        logger.warning("[WARNING] Failed to save checkpoint: %s", e)
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
-def load_checkpoint(checkpoint_file: str) -> tuple[set, list, int]:
-    """Load progress checkpoint from file"""
+def append_checkpoint(checkpoint_log: typing.BinaryIO, batch_number: int, batch_scan_mapping: list, batch_failed: int) -> None:
+    """Append one completed batch to the checkpoint log"""
+    try:
+        checkpoint_log.write(dump_json({'b': batch_number, 'm': batch_scan_mapping, 'f': batch_failed}) + b'\n')
+        checkpoint_log.flush()
+        os.fsync(checkpoint_log.fileno())
+    except Exception as e:
+        logger.warning("[WARNING] Failed to save checkpoint: %s", e)
+
+def load_checkpoint(checkpoint_file: str) -> tuple[set, list, int, typing.Optional[str]]:
+    """Load progress checkpoint by replaying the checkpoint log"""
     if not os.path.exists(checkpoint_file):
-        return set(), [], 0
+        return set(), [], 0, None
     
     try:
-        with open(checkpoint_file, 'r', encoding='utf-8') as f:
-            checkpoint_data = json.load(f)
+        with open(checkpoint_file, 'rb') as f:
+            lines = f.read().splitlines()
+        checkpoint_data = load_json(lines[0])
         completed_batches = set(checkpoint_data.get('completed_batches', []))
         scan_mapping = checkpoint_data.get('scan_mapping', [])
         failed_scans = checkpoint_data.get('failed_scans', 0)
-        print(f"[CHECKPOINT] Loaded checkpoint: {len(completed_batches)} batches completed, {len(scan_mapping)} scans mapped, {failed_scans} failed")
-        return completed_batches, scan_mapping, failed_scans
+        csv_filename = checkpoint_data.get('csv_filename')
+        for line_number, line in enumerate(lines[1:], start=2):
+            try:
+                record = load_json(line)
+            except ValueError:
+                # Only the last line can be cut short, by a crash while it was being written
+                if line_number == len(lines):
+                    break
+                raise
+            completed_batches.add(record['b'])
+            scan_mapping.extend(record['m'])
+            failed_scans += record['f']
+        logger.info("[CHECKPOINT] Loaded checkpoint: %s batches completed, %s scans mapped, %s failed", len(completed_batches), len(scan_mapping), failed_scans)
+        return completed_batches, scan_mapping, failed_scans, csv_filename
     except Exception as e:
-        print(f"[WARNING] Failed to load checkpoint: {e}, starting fresh")
-        return set(), [], 0
+        logger.warning("[WARNING] Failed to load checkpoint: %s, starting fresh", e)
+        return set(), [], 0, None
+
+def read_scan_mapping(csv_filename: str) -> list[tuple[int, int]]:
+    """Read the (source, target) scan ID pairs already written to a mapping CSV"""
+    with open(csv_filename, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader, None)  # Header
+        return [(int(row[0]), int(row[1])) for row in reader if len(row) == 2]
+
+def format_mapping_row(source_scan_id: int, new_scan_id: str) -> bytes:
+    """One mapping CSV row; both columns are plain IDs, so no quoting is needed"""
+    return f'{source_scan_id},{new_scan_id}\r\n'.encode()
+
+def append_scan_mapping(csvfile: typing.BinaryIO, source_scan_id: int, new_scan_id: str) -> None:
+    """Write one mapping row and force it to disk, so a crash never loses a created scan"""
+    csvfile.write(format_mapping_row(source_scan_id, new_scan_id))
+    csvfile.flush()
+    os.fsync(csvfile.fileno())
+
+# Source scan fields that must not be sent when creating the target scan
+_FIELDS_TO_REMOVE = frozenset({
+    'category_id', 'section_id', 'store_planogram', 'aisle', 'task_id', 'replace_id',
+    'id', 'created_at', 'updated_at',
+})
+
+def prepare_scan_data(scan_info: dict, file_ids: typing.Optional[tuple], uploaded_files_map: dict, *, batch_number: int, target_store_id: int, captured_at: int) -> typing.Optional[dict]:
+    """Build the create-scan payload for a source scan, or return None if the scan has to be skipped"""
+    source_scan_id = scan_info['id']
+    # Only top-level keys are changed, so a shallow copy is enough
+    data = {key: value for key, value in scan_info['provided_values']['_raw_data'].items() if key not in _FIELDS_TO_REMOVE}
+    data['store'] = target_store_id
+    
+    # file_ids is None when the source scan came back without scan_files
+    if file_ids is None:
+        logger.error("[BATCH %s] [ERROR] scan_files is None for scan %s!", batch_number, source_scan_id)
+        logger.error("[BATCH %s] [ERROR] scan_info keys: %s", batch_number, list(scan_info.keys()))
+        logger.error("[BATCH %s] [ERROR] scan_info: %s", batch_number, scan_info)
+        return None
+    
+    data['files'] = [upload_id for upload_id in map(uploaded_files_map.get, file_ids) if upload_id]  # Filter out missing uploads
+    data['captured_at'] = captured_at
+    logger.debug("[BATCH %s] [PREPARE] Data: %s", batch_number, data)
+    if not data['files']:
+        logger.warning("[BATCH %s] [WARNING] No files available for source scan %s, skipping scan creation", batch_number, source_scan_id)
+        return None
+    
+    # Log the prepared data for this scan (LOG_LEVEL=DEBUG only)
+    logger.debug("[BATCH %s] [PREPARE] Prepared scan data for source %s:", batch_number, source_scan_id)
+    logger.debug("[BATCH %s] [PREPARE] Store: %s, Files count: %s, Captured_at: %s", batch_number, data['store'], len(data['files']), data['captured_at'])
+    logger.debug("[BATCH %s] [PREPARE] Data keys: %s", batch_number, list(data))
+    
+    return data
+
+# Full tracebacks logged per batch for unexpected errors; later ones log only the message
+MAX_BATCH_TRACEBACKS = 3
+
+class InFlightCopies:
+    """File copies in flight, shared by the batches of a run so a file needed by two batches
+    running side by side is copied only once.
+    Each copy counts the batches waiting on it; only the last one to let go may cancel it."""
+
+    def __init__(self, uploaded_files_map: dict):
+        self._uploaded_files_map = uploaded_files_map
+        self._lock = threading.Lock()
+        self._copies = {}  # file ID -> [future, number of batches waiting on it]
+    
+    def get_or_submit(self, file_id, submit: typing.Callable[[], Future]) -> Future:
+        """Future of the copy of file_id, joining a copy already in flight or submitting a new one"""
+        with self._lock:
+            entry = self._copies.get(file_id)
+            if entry is not None and entry[0].done() and (entry[0].cancelled() or entry[0].exception() is not None):
+                entry = None  # A failed copy is tried again rather than shared
+            if entry is None:
+                # Checked under the lock: a copy is recorded in uploaded_files_map before it is released
+                if file_id in self._uploaded_files_map:
+                    future = Future()
+                    future.set_result((file_id, self._uploaded_files_map[file_id]))
+                    return future
+                entry = self._copies[file_id] = [submit(), 0]
+            entry[1] += 1
+            return entry[0]
+    
+    def release(self, file_id, future: Future) -> bool:
+        """Stop waiting on a copy; returns True when no other batch still waits on it"""
+        with self._lock:
+            entry = self._copies.get(file_id)
+            if entry is None or entry[0] is not future:
+                return True
+            entry[1] -= 1
+            if entry[1] > 0:
+                return False
+            del self._copies[file_id]
+            return True
 
 def process_batch_with_retry(
     batch_number: int,
@@ -355,258 +819,304 @@ def process_batch_with_retry(
     total_scans: int,
     from_instance: str,
     to_instance: str,
-    auth_token_1: str,
-    auth_token_2: str,
+    auth_token_1: AuthToken,
+    auth_token_2: AuthToken,
     target_store_id: int,
     captured_at: int,
-    max_batch_retries: int = 3
+    max_batch_retries: int = 3,
+    on_scan_created: typing.Optional[typing.Callable[[int, str], None]] = None,
+    uploaded_files_map: typing.Optional[dict] = None,
+    *,
+    copy_executor: ThreadPoolExecutor,
+    scan_executor: ThreadPoolExecutor,
+    in_flight_copies: typing.Optional[InFlightCopies] = None,
+    stop_event: typing.Optional[threading.Event] = None,
+    initial_backoff: float = 5.0,
+    max_backoff: float = 60.0
 ) -> tuple[list, list, int]:
     """
     Process a single batch with retry logic.
+    Files are copied concurrently and every scan is created as soon as its own files
+    are in the target instance, so scan creation overlaps the remaining copies.
+    Copied files and created scans are kept across retries and never redone.
+    on_scan_created is called with (source_scan_id, new_scan_id) as soon as each scan is created.
+    uploaded_files_map (source file ID -> upload ID) can be shared between batches so a file
+    referenced by scans in several batches is only copied once; in_flight_copies, built on the same
+    map, lets batches running side by side wait on each other's copies instead of copying again.
+    copy_executor and scan_executor are shared by all batches of a run; at most current_file_workers()
+    copies of this batch are in flight on copy_executor at a time.
+    Once stop_event is set no further attempt is started.
+    Retries wait with decorrelated jitter: a random delay between initial_backoff and three times
+    the previous delay, capped at max_backoff, so batches failing together do not retry together.
     Returns: (new_scan_ids, scan_mapping, failed_scans)
     """
     batch_count = len(batch_scans)
+    if uploaded_files_map is None:
+        uploaded_files_map = {}
+    if in_flight_copies is None:
+        in_flight_copies = InFlightCopies(uploaded_files_map)
+    if stop_event is None:
+        stop_event = threading.Event()
+    batch_new_scan_ids = []
+    batch_scan_mapping = []
+    created_source_scan_ids = set()
+    failed_scans = 0
+    tracebacks_logged = 0
     
+    # File IDs of every scan, looked up once for all attempts (None when scan_files is missing)
+    batch_file_ids = {}
+    for scan_info in batch_scans:
+        scan_files = scan_info.get('scan_files', [])
+        if scan_files is None:
+            logger.warning("[BATCH %s] [WARNING] scan_files is None for scan %s, skipping", batch_number, scan_info.get('id', 'unknown'))
+            batch_file_ids[scan_info['id']] = None
+        else:
+            batch_file_ids[scan_info['id']] = tuple(
+                scan_file['file_id'] for scan_file in scan_files if scan_file and 'file_id' in scan_file
+            )
+    
+    backoff = initial_backoff
     for retry_attempt in range(max_batch_retries + 1):
         if retry_attempt > 0:
-            print(f"[BATCH {batch_number}] Retry attempt {retry_attempt}/{max_batch_retries}")
-            time.sleep(5 * retry_attempt)  # Exponential backoff between retries
+            backoff = min(max_backoff, random.uniform(initial_backoff, backoff * 3))
+            logger.warning("[BATCH %s] Backing off %.1fs before retry attempt %s/%s", batch_number, backoff, retry_attempt, max_batch_retries)
+            stop_event.wait(backoff)  # Cut short when the run stops
+        if stop_event.is_set():
+            logger.info("[BATCH %s] Run is stopping, batch abandoned", batch_number)
+            return batch_new_scan_ids, batch_scan_mapping, batch_count - len(batch_scan_mapping)
+        final_attempt = retry_attempt == max_batch_retries
         
         try:
             # ---------------------------
-            # Download files for this batch
+            # Work out which files each pending scan still needs
             # ---------------------------
-            downloaded_files_map = {}
-            # Safely collect file IDs, handling None scan_files
-            file_ids_to_download = []
-            for scan_info in batch_scans:
-                scan_files = scan_info.get('scan_files', [])
-                if scan_files is None:
-                    print(f"[BATCH {batch_number}] [WARNING] scan_files is None for scan {scan_info.get('id', 'unknown')}, skipping", flush=True)
-                    continue
-                for scan_file in scan_files:
-                    if scan_file and 'file_id' in scan_file:
-                        file_ids_to_download.append(scan_file['file_id'])
-            file_ids_to_download = list(set(file_ids_to_download))  # Remove duplicates
+            pending_scans = [scan_info for scan_info in batch_scans if scan_info['id'] not in created_source_scan_ids]
+            scan_file_ids = {}  # source scan ID -> file IDs it needs copied in this attempt
+            files_left = {}  # source scan ID -> file IDs not yet copied
+            waiting_scans = {}  # file ID -> scans waiting for it
+            for scan_info in pending_scans:
+                needed = {
+                    file_id for file_id in batch_file_ids[scan_info['id']] or ()
+                    if file_id not in uploaded_files_map
+                }
+                scan_file_ids[scan_info['id']] = frozenset(needed)
+                files_left[scan_info['id']] = needed
+                for file_id in needed:
+                    waiting_scans.setdefault(file_id, []).append(scan_info)
+            file_ids_to_copy = list(waiting_scans)
+            failed_file_ids = set()
+            deferred_scans = []  # scans with a failed file, created only once the copy stage is judged
+            copy_ok = True
             
-            if not file_ids_to_download:
-                print(f"[BATCH {batch_number}] No files to download (skipping download/upload stage)", flush=True)
-            else:
-                print(f"[BATCH {batch_number}] Starting download of {len(file_ids_to_download)} files", flush=True)
-                max_workers = min(20, len(file_ids_to_download))
-                with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    download_futures = {
-                        executor.submit(download_file_threaded, file_id, from_instance, auth_token_1): file_id 
-                        for file_id in file_ids_to_download
-                    }
-                    
-                    completed_downloads = 0
-                    for future in as_completed(download_futures):
-                        try:
-                            file_id, file_info = future.result()
-                            downloaded_files_map[file_id] = file_info
-                            completed_downloads += 1
-                            if completed_downloads % max(1, min(50, len(file_ids_to_download) // 10)) == 0 or completed_downloads == len(file_ids_to_download):
-                                print(f"[BATCH {batch_number}] [DOWNLOAD] {completed_downloads}/{len(file_ids_to_download)} ({completed_downloads*100//len(file_ids_to_download)}%)")
-                        except Exception as e:
-                            file_id = download_futures[future]
-                            print(f"[BATCH {batch_number}] [ERROR] Failed to download file {file_id}: {e}")
-                            if retry_attempt == max_batch_retries:
-                                raise  # Re-raise on final attempt
-                
-                print(f"[BATCH {batch_number}] Downloaded {len(downloaded_files_map)}/{len(file_ids_to_download)} files", flush=True)
-                
-                # Check if we have enough files downloaded
-                if len(downloaded_files_map) < len(file_ids_to_download) * 0.8:  # Less than 80% success
-                    if retry_attempt < max_batch_retries:
-                        print(f"[BATCH {batch_number}] Too many download failures, retrying batch...")
-                        continue
-                    else:
-                        print(f"[BATCH {batch_number}] Too many download failures after {max_batch_retries} retries, continuing with available files")
+            completed_copies = 0
+            completed_scans = 0
+            failed_scans = 0
+            too_many_failures = False
+            # Progress lines are printed every copy_step copies / scan_step scans, and at least once a minute
+            copy_step = max(1, min(50, len(file_ids_to_copy) // 10))
+            scan_step = max(1, min(25, len(pending_scans) // 10))
+            next_scan_mark = scan_step
+            start_time = time.monotonic()
+            next_progress_time = start_time + 60
             
-            # ---------------------------
-            # Upload files for this batch
-            # ---------------------------
-            uploaded_files_map = {}
-            if downloaded_files_map:
-                print(f"[BATCH {batch_number}] Starting upload of {len(downloaded_files_map)} files", flush=True)
-                max_workers = min(20, len(downloaded_files_map))
-                with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    upload_futures = {
-                        executor.submit(upload_file_threaded, file_id, file_info, to_instance, auth_token_2): file_id 
-                        for file_id, file_info in downloaded_files_map.items()
-                    }
-                    
-                    completed_uploads = 0
-                    for future in as_completed(upload_futures):
-                        try:
-                            file_id, upload_id = future.result()
-                            uploaded_files_map[file_id] = upload_id
-                            completed_uploads += 1
-                            if completed_uploads % max(1, min(50, len(downloaded_files_map) // 10)) == 0 or completed_uploads == len(downloaded_files_map):
-                                print(f"[BATCH {batch_number}] [UPLOAD] {completed_uploads}/{len(downloaded_files_map)} ({completed_uploads*100//len(downloaded_files_map)}%)")
-                        except Exception as e:
-                            file_id = upload_futures[future]
-                            print(f"[BATCH {batch_number}] [ERROR] Failed to upload file {file_id}: {e}")
-                            if retry_attempt == max_batch_retries:
-                                raise  # Re-raise on final attempt
-                
-                print(f"[BATCH {batch_number}] Uploaded {len(uploaded_files_map)}/{len(downloaded_files_map)} files", flush=True)
-                
-                # Check if we have enough files uploaded
-                if len(uploaded_files_map) < len(downloaded_files_map) * 0.8:  # Less than 80% success
-                    if retry_attempt < max_batch_retries:
-                        print(f"[BATCH {batch_number}] Too many upload failures, retrying batch...")
-                        continue
-                    else:
-                        print(f"[BATCH {batch_number}] Too many upload failures after {max_batch_retries} retries, continuing with available files")
+            if file_ids_to_copy:
+                logger.info("[BATCH %s] Starting copy of %s files", batch_number, len(file_ids_to_copy))
             else:
-                print(f"[BATCH {batch_number}] Skipping upload stage (no downloaded files)")
+                logger.info("[BATCH %s] No files to copy (skipping copy stage)", batch_number)
             
-            # ---------------------------
-            # Prepare scan data for this batch
-            # ---------------------------
-            scan_data_list = []
-            for scan_info in batch_scans:
-                source_scan_id = scan_info['id']
-                data = deepcopy(scan_info['provided_values']['_raw_data'])
-                
-                fields_to_remove = ['category_id', 'section_id', 'store_planogram', 'aisle', 'task_id', 'replace_id']
-                for field in fields_to_remove:
-                    if field in data:
-                        del data[field]
-                
-                data['store'] = target_store_id
-                
-                # Safely access scan_files
-                scan_files = scan_info.get('scan_files', [])
-                if scan_files is None:
-                    print(f"[BATCH {batch_number}] [ERROR] scan_files is None for scan {source_scan_id}!", flush=True)
-                    print(f"[BATCH {batch_number}] [ERROR] scan_info keys: {list(scan_info.keys())}", flush=True)
-                    print(f"[BATCH {batch_number}] [ERROR] scan_info: {scan_info}", flush=True)
-                    continue
+            pending = set()
+            try:
+                copy_futures = {}
+                scan_futures = {}
+                new_futures = []  # submitted while handling completions, waited on from the next round
+                copy_queue = collections.deque(file_ids_to_copy)
+                copy_limit = current_file_workers()
+                copies_in_flight = 0
                 
-                data['files'] = [uploaded_files_map.get(scan_file.get('file_id')) for scan_file in scan_files if scan_file and 'file_id' in scan_file]
-                data['files'] = [file_id for file_id in data['files'] if file_id]  # Filter out missing uploads
-                data['captured_at'] = captured_at
+                def submit_copies() -> None:
+                    nonlocal copies_in_flight
+                    while copy_queue and copies_in_flight < copy_limit:
+                        file_id = copy_queue.popleft()
+                        future = in_flight_copies.get_or_submit(
+                            file_id,
+                            lambda file_id=file_id: copy_executor.submit(copy_file_threaded, file_id, from_instance, auth_token_1, to_instance, auth_token_2),
+                        )
+                        copy_futures[future] = file_id
+                        new_futures.append(future)
+                        copies_in_flight += 1
                 
-                additional_fields_to_remove = ['id', 'created_at', 'updated_at']
-                for field in additional_fields_to_remove:
-                    if field in data:
-                        del data[field]
-                print(f"[BATCH {batch_number}] [PREPARE] Data: {data}", flush=True)
-                if not data['files']:
-                    print(f"[BATCH {batch_number}] [WARNING] No files available for source scan {source_scan_id}, skipping scan creation", flush=True)
-                    continue
+                def submit_scan(scan_info: dict) -> None:
+                    data = prepare_scan_data(
+                        scan_info,
+                        batch_file_ids[scan_info['id']],
+                        uploaded_files_map,
+                        batch_number=batch_number,
+                        target_store_id=target_store_id,
+                        captured_at=captured_at,
+                    )
+                    if data is not None:
+                        future = scan_executor.submit(create_scan_threaded, data, scan_info['id'], to_instance, auth_token_2)
+                        scan_futures[future] = scan_info['id']
+                        new_futures.append(future)
                 
-                # Log the prepared data for this scan
-                print(f"[BATCH {batch_number}] [PREPARE] Prepared scan data for source {source_scan_id}:", flush=True)
-                print(f"[BATCH {batch_number}] [PREPARE] Store: {data.get('store')}, Files count: {len(data.get('files', []))}, Captured_at: {data.get('captured_at')}", flush=True)
-                print(f"[BATCH {batch_number}] [PREPARE] Data keys: {list(data.keys())}", flush=True)
+                submit_copies()
+                # Scans whose files are all in the target already can be created right away
+                for scan_info in pending_scans:
+                    if not files_left[scan_info['id']]:
+                        submit_scan(scan_info)
                 
-                scan_data_list.append((source_scan_id, data))
+                pending.update(new_futures)
+                new_futures.clear()
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in copy_futures:
+                            # ---------------------------
+                            # A file copy finished: start the next one and release the scans waiting on it
+                            # ---------------------------
+                            file_id = copy_futures[future]
+                            copies_in_flight -= 1
+                            submit_copies()
+                            try:
+                                _, upload_id = future.result()
+                                uploaded_files_map[file_id] = upload_id
+                                completed_copies += 1
+                                if completed_copies % copy_step == 0 or completed_copies == len(file_ids_to_copy):
+                                    logger.info("[BATCH %s] [COPY] %s/%s (%s%%)", batch_number, completed_copies, len(file_ids_to_copy), completed_copies*100//len(file_ids_to_copy))
+                            except Exception as e:
+                                failed_file_ids.add(file_id)
+                                logger.error("[BATCH %s] [ERROR] Failed to copy file %s: %s", batch_number, file_id, e)
+                            in_flight_copies.release(file_id, future)
+                            
+                            for scan_info in waiting_scans[file_id]:
+                                left = files_left[scan_info['id']]
+                                left.discard(file_id)
+                                if left:
+                                    continue
+                                if scan_file_ids[scan_info['id']] & failed_file_ids:
+                                    deferred_scans.append(scan_info)
+                                elif not too_many_failures:
+                                    submit_scan(scan_info)
+                            
+                            if completed_copies + len(failed_file_ids) == len(file_ids_to_copy):
+                                logger.info("[BATCH %s] Copied %s/%s files", batch_number, completed_copies, len(file_ids_to_copy))
+                                record_copy_stage(completed_copies, len(failed_file_ids))
+                                # Check if we have enough files copied
+                                copy_ok = completed_copies >= len(file_ids_to_copy) * 0.8  # At least 80% success
+                                if copy_ok or final_attempt:
+                                    if not copy_ok:
+                                        logger.info("[BATCH %s] Too many copy failures after %s retries, continuing with available files", batch_number, max_batch_retries)
+                                    for scan_info in deferred_scans:
+                                        if not too_many_failures:
+                                            submit_scan(scan_info)
+                                    deferred_scans = []
+                                else:
+                                    logger.info("[BATCH %s] Too many copy failures, %s scans will be retried", batch_number, len(deferred_scans))
+                        else:
+                            # ---------------------------
+                            # A scan creation finished
+                            # ---------------------------
+                            source_scan_id = scan_futures[future]
+                            if future.cancelled():
+                                continue
+                            try:
+                                result = future.result()
+                                if result is None:
+                                    logger.error("[BATCH %s] [ERROR] Future returned None result!", batch_number)
+                                    logger.error("[BATCH %s] [ERROR] Source scan ID: %s", batch_number, source_scan_id)
+                                    failed_scans += 1
+                                    continue
+                                
+                                if not isinstance(result, tuple) or len(result) != 2:
+                                    logger.error("[BATCH %s] [ERROR] Future returned invalid result format: %s!", batch_number, result)
+                                    logger.error("[BATCH %s] [ERROR] Source scan ID: %s", batch_number, source_scan_id)
+                                    failed_scans += 1
+                                    continue
+                                
+                                source_scan_id, new_scan_id = result
+                                
+                                if new_scan_id is None:
+                                    logger.error("[BATCH %s] [ERROR] New scan ID is None for source %s!", batch_number, source_scan_id)
+                                    failed_scans += 1
+                                    continue
+                                
+                                batch_new_scan_ids.append(new_scan_id)
+                                batch_scan_mapping.append((source_scan_id, new_scan_id))
+                                created_source_scan_ids.add(source_scan_id)
+                                if on_scan_created is not None:
+                                    on_scan_created(source_scan_id, new_scan_id)
+                                completed_scans += 1
+                                now = time.monotonic()
+                                
+                                if completed_scans >= next_scan_mark or completed_scans == len(pending_scans) or now >= next_progress_time:
+                                    next_scan_mark = completed_scans + scan_step
+                                    next_progress_time = now + 60
+                                    elapsed_time = now - start_time
+                                    avg_time_per_scan = elapsed_time / completed_scans if completed_scans > 0 else 0
+                                    remaining_scans = len(pending_scans) - completed_scans
+                                    estimated_remaining_time = avg_time_per_scan * remaining_scans if avg_time_per_scan > 0 else 0
+                                    logger.info("[BATCH %s] [SCAN] %s/%s (%s%%) | Elapsed: %.1fs | Est. remaining: %.1fs", batch_number, completed_scans, len(pending_scans), completed_scans*100//len(pending_scans), elapsed_time, estimated_remaining_time)
+                                    
+                            except Exception as e:
+                                failed_scans += 1
+                                logger.error("[BATCH %s] [ERROR] Failed to create scan for source %s: %s", batch_number, source_scan_id, e)
+                                if failed_scans > len(pending_scans) * 0.5 and not too_many_failures:
+                                    logger.error("[BATCH %s] [ERROR] Too many failures (%s) in this batch", batch_number, failed_scans)
+                                    if not final_attempt:
+                                        logger.info("[BATCH %s] Retrying batch...", batch_number)
+                                    # Stop creating scans; those already running are still collected
+                                    too_many_failures = True
+                                    for f in scan_futures:
+                                        if not f.done():
+                                            f.cancel()
+                    pending.update(new_futures)
+                    new_futures.clear()
+            finally:
+                # Nothing from this attempt may keep running into a retry: drop queued work, wait for the rest.
+                # A copy another batch still waits on is left running for that batch.
+                pending.update(new_futures)
+                own_futures = []
+                for future in pending:
+                    if future in copy_futures and not in_flight_copies.release(copy_futures[future], future):
+                        continue
+                    future.cancel()
+                    own_futures.append(future)
+                wait(own_futures)
             
-            if not scan_data_list:
-                print(f"[BATCH {batch_number}] No scan data available to create scans")
-                return [], [], 0
+            if not copy_ok and not final_attempt:
+                logger.info("[BATCH %s] Too many copy failures, retrying batch...", batch_number)
+                continue
             
-            # ---------------------------
-            # Create new scans for this batch
-            # ---------------------------
-            print(f"[BATCH {batch_number}] Creating {len(scan_data_list)} scans", flush=True)
-            max_workers = min(15, len(scan_data_list))
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                scan_futures = {
-                    executor.submit(create_scan_threaded, data, source_scan_id, to_instance, auth_token_2): source_scan_id 
-                    for source_scan_id, data in scan_data_list
-                }
-                
-                completed_scans = 0
-                failed_scans = 0
-                batch_new_scan_ids = []
-                batch_scan_mapping = []
-                start_time = time.time()
-                last_progress_time = start_time
-                
-                for future in as_completed(scan_futures):
-                    try:
-                        result = future.result()
-                        if result is None:
-                            print(f"[BATCH {batch_number}] [ERROR] Future returned None result!", flush=True)
-                            source_scan_id = scan_futures[future]
-                            print(f"[BATCH {batch_number}] [ERROR] Source scan ID: {source_scan_id}", flush=True)
-                            failed_scans += 1
-                            continue
-                        
-                        if not isinstance(result, tuple) or len(result) != 2:
-                            print(f"[BATCH {batch_number}] [ERROR] Future returned invalid result format: {result}!", flush=True)
-                            source_scan_id = scan_futures[future]
-                            print(f"[BATCH {batch_number}] [ERROR] Source scan ID: {source_scan_id}", flush=True)
-                            failed_scans += 1
-                            continue
-                        
-                        source_scan_id, new_scan_id = result
-                        
-                        if new_scan_id is None:
-                            print(f"[BATCH {batch_number}] [ERROR] New scan ID is None for source {source_scan_id}!", flush=True)
-                            failed_scans += 1
-                            continue
-                        
-                        batch_new_scan_ids.append(new_scan_id)
-                        batch_scan_mapping.append((source_scan_id, new_scan_id))
-                        completed_scans += 1
-                        elapsed_time = time.time() - start_time
-                        
-                        should_print = (
-                            completed_scans % max(1, min(25, len(scan_data_list) // 10)) == 0 or 
-                            completed_scans == len(scan_data_list) or
-                            (time.time() - last_progress_time) >= 60
-                        )
-                        
-                        if should_print:
-                            last_progress_time = time.time()
-                            avg_time_per_scan = elapsed_time / completed_scans if completed_scans > 0 else 0
-                            remaining_scans = len(scan_data_list) - completed_scans
-                            estimated_remaining_time = avg_time_per_scan * remaining_scans if avg_time_per_scan > 0 else 0
-                            print(f"[BATCH {batch_number}] [SCAN] {completed_scans}/{len(scan_data_list)} ({completed_scans*100//len(scan_data_list)}%) | Elapsed: {elapsed_time:.1f}s | Est. remaining: {estimated_remaining_time:.1f}s")
-                            
-                    except Exception as e:
-                        source_scan_id = scan_futures[future]
-                        failed_scans += 1
-                        print(f"[BATCH {batch_number}] [ERROR] Failed to create scan for source {source_scan_id}: {e}")
-                        if failed_scans > len(scan_data_list) * 0.5:
-                            print(f"[BATCH {batch_number}] [ERROR] Too many failures ({failed_scans}) in this batch")
-                            if retry_attempt < max_batch_retries:
-                                print(f"[BATCH {batch_number}] Retrying batch...")
-                                break  # Break out of future processing, will retry
-                            else:
-                                # Cancel remaining futures on final attempt
-                                for f in scan_futures:
-                                    if not f.done():
-                                        f.cancel()
-                                break
+            if not scan_futures:
+                logger.info("[BATCH %s] No scan data available to create scans", batch_number)
+                return batch_new_scan_ids, batch_scan_mapping, 0
             
             # Check if batch was successful enough
-            success_rate = completed_scans / len(scan_data_list) if scan_data_list else 0
-            if success_rate < 0.5 and retry_attempt < max_batch_retries:
-                print(f"[BATCH {batch_number}] Low success rate ({success_rate*100:.1f}%), retrying batch...")
+            success_rate = completed_scans / len(scan_futures)
+            if success_rate < 0.5 and not final_attempt:
+                logger.info("[BATCH %s] Low success rate (%.1f%%), retrying batch...", batch_number, success_rate*100)
                 continue
             
             # Batch completed successfully (or on final retry)
-            print(f"[BATCH {batch_number}] Completed scan creation for this batch (success: {completed_scans}, failed: {failed_scans})", flush=True)
+            logger.info("[BATCH %s] Completed scan creation for this batch (success: %s, failed: %s)", batch_number, len(batch_scan_mapping), failed_scans)
             return batch_new_scan_ids, batch_scan_mapping, failed_scans
             
         except Exception as e:
-            print(f"[BATCH {batch_number}] [ERROR] Batch processing failed: {e}")
+            logger.error("[BATCH %s] [ERROR] Batch processing failed: %s", batch_number, e)
+            # Network and HTTP errors are expected during outages and their message says enough
+            if not isinstance(e, requests.exceptions.RequestException) and tracebacks_logged < MAX_BATCH_TRACEBACKS:
+                tracebacks_logged += 1
+                logger.error("[BATCH %s] [ERROR] Traceback:", batch_number, exc_info=True)
             if retry_attempt < max_batch_retries:
-                print(f"[BATCH {batch_number}] Will retry batch...")
+                logger.info("[BATCH %s] Will retry batch...", batch_number)
                 continue
             else:
-                print(f"[BATCH {batch_number}] Max retries exceeded, skipping batch")
-                return [], [], len(batch_scans)  # All scans in batch failed
+                logger.info("[BATCH %s] Max retries exceeded, skipping batch", batch_number)
+                # Scans created by earlier attempts exist on the target and are already in the CSV
+                return batch_new_scan_ids, batch_scan_mapping, batch_count - len(batch_scan_mapping)
     
     # Should never reach here, but just in case
-    return [], [], len(batch_scans)
+    return batch_new_scan_ids, batch_scan_mapping, batch_count - len(batch_scan_mapping)
 
 def run(*,
         from_instance: str,
@@ -624,93 +1134,99 @@ def run(*,
         batch_retries: int = 3,
         resume: bool = True) -> None:
     try:
-        print('Obtaining tokens...', flush=True)
-        _, auth_token_1 = get_auth_token(from_instance, source_username, source_password)
-        print(f"Auth token 1 obtained for {from_instance}", flush=True)
-        _, auth_token_2 = get_auth_token(to_instance, target_username, target_password)
-        print(f"Auth token 2 obtained for {to_instance}", flush=True)
+        logger.info("Obtaining tokens...")
+        auth_token_1 = AuthToken(from_instance, source_username, source_password)
+        auth_token_2 = AuthToken(to_instance, target_username, target_password)
+        # The two instances are independent, so both logins run at the same time
+        with ThreadPoolExecutor(max_workers=2) as auth_executor:
+            auth_future_1 = auth_executor.submit(auth_token_1.get)
+            auth_future_2 = auth_executor.submit(auth_token_2.get)
+            auth_future_1.result()
+            logger.info("Auth token 1 obtained for %s", from_instance)
+            auth_future_2.result()
+            logger.info("Auth token 2 obtained for %s", to_instance)
 
-        print('Getting info about scans...', flush=True)
+        logger.info("Getting info about scans...")
+        # Rows are streamed and consumed batch by batch, so copying starts before the query has finished
         scans_info = get_info_about_scans(scan_ids_for_copying, instance_name=from_instance, db_password=first_db_password)
-        print(f"Retrieved info for {len(scans_info)} scans", flush=True)
+        total_scans = len(set(scan_ids_for_copying))  # Upper bound; IDs missing from the source return no row
+        logger.info("Streaming info for up to %s scans", total_scans)
 
-        total_scans = len(scans_info)
         batch_size = 10
-        print(f"[BATCH] Processing scans in groups of {batch_size} (total scans: {total_scans})", flush=True)
-        print(f"[BATCH] Batch retries enabled: {batch_retries} attempts per batch", flush=True)
+        logger.info("[BATCH] Processing scans in groups of %s (total scans: %s)", batch_size, total_scans)
+        logger.info("[BATCH] Batch retries enabled: %s attempts per batch", batch_retries)
         
         # Setup checkpoint file
-        checkpoint_file = f"checkpoint_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        checkpoint_file = f"checkpoint_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
         if resume:
-            print(f"[CHECKPOINT] Checkpoint file: {checkpoint_file}")
+            logger.info("[CHECKPOINT] Checkpoint file: %s", checkpoint_file)
             # Try to find existing checkpoint file
-            checkpoint_files = [f for f in os.listdir('.') if f.startswith('checkpoint_') and f.endswith('.json')]
+            checkpoint_files = [f for f in os.listdir('.') if f.startswith('checkpoint_') and f.endswith('.log')]
             if checkpoint_files:
-                # Use most recent checkpoint
-                checkpoint_file = max(checkpoint_files, key=os.path.getmtime)
-                print(f"[CHECKPOINT] Found existing checkpoint: {checkpoint_file}")
+                # Use most recent checkpoint; the timestamp in the name sorts by age, no stat() needed
+                checkpoint_file = max(checkpoint_files)
+                logger.info("[CHECKPOINT] Found existing checkpoint: %s", checkpoint_file)
         
         # Load checkpoint if resuming
         completed_batches = set()
         scan_mapping = []
         total_failed_scans = 0
+        csv_filename = None
         if resume:
-            completed_batches, scan_mapping, total_failed_scans = load_checkpoint(checkpoint_file)
+            completed_batches, scan_mapping, total_failed_scans, csv_filename = load_checkpoint(checkpoint_file)
             if completed_batches:
-                print(f"[RESUME] Resuming from batch {max(completed_batches) + 1}, {len(scan_mapping)} scans already completed")
+                logger.info("[RESUME] Resuming from batch %s, %s scans already completed", max(completed_batches) + 1, len(scan_mapping))
+        
+        # The mapping CSV is written as scans are created; a resumed run appends to the same file
+        if csv_filename is None:
+            csv_filename = f"scan_mapping_updated_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        csv_exists = os.path.exists(csv_filename) and os.path.getsize(csv_filename) > 0
+        if csv_exists:
+            # The CSV also holds scans created by a batch that did not finish before the last run stopped
+            scan_mapping = read_scan_mapping(csv_filename)
+            logger.info("[RESUME] %s scans already in %s, they will not be copied again", len(scan_mapping), csv_filename)
+        copied_source_scan_ids = {mapping[0] for mapping in scan_mapping}
         
         new_scan_ids = [mapping[1] for mapping in scan_mapping]  # Extract target scan IDs
         
-        # Process batches
-        total_batches = (total_scans + batch_size - 1) // batch_size
-        for batch_start in range(0, total_scans, batch_size):
-            batch_number = (batch_start // batch_size) + 1
-            
-            # Skip if batch already completed
-            if batch_number in completed_batches:
-                print(f"\n{'='*80}", flush=True)
-                print(f"[BATCH {batch_number}/{total_batches}] Already completed, skipping...", flush=True)
-                print(f"{'='*80}\n", flush=True)
-                continue
-            
-            batch_scans = scans_info[batch_start:batch_start + batch_size]
-            batch_count = len(batch_scans)
-            
-            # Extract source scan IDs for this batch
-            batch_source_scan_ids = [scan_info['id'] for scan_info in batch_scans]
-            
-            # Print batch start with scan IDs
-            print(f"\n{'='*80}", flush=True)
-            print(f"[BATCH {batch_number}/{total_batches}] Starting batch {batch_number}", flush=True)
-            print(f"[BATCH {batch_number}/{total_batches}] Processing scans {batch_start + 1}-{batch_start + batch_count} of {total_scans}", flush=True)
-            print(f"[BATCH {batch_number}/{total_batches}] Source Scan IDs: {', '.join(map(str, batch_source_scan_ids))}", flush=True)
-            print(f"{'='*80}\n", flush=True)
-            
-            # Process batch with retry logic
-            batch_new_scan_ids, batch_scan_mapping, batch_failed = process_batch_with_retry(
-                batch_number=batch_number,
-                batch_scans=batch_scans,
-                batch_start=batch_start,
-                total_scans=total_scans,
-                from_instance=from_instance,
-                to_instance=to_instance,
-                auth_token_1=auth_token_1,
-                auth_token_2=auth_token_2,
-                target_store_id=target_store_id,
-                captured_at=captured_at,
-                max_batch_retries=batch_retries
-            )
+        logger.info("Writing scan mapping to CSV file: %s", csv_filename)
+        csvfile = open(csv_filename, 'ab')
+        if not csv_exists:
+            csvfile.write(b'Source_Scan_ID,Target_Scan_ID\r\n')
+            csvfile.writelines(format_mapping_row(*mapping) for mapping in scan_mapping)
+            csvfile.flush()
+        
+        csv_lock = threading.Lock()  # scans of pipelined batches are recorded from their batch threads
+        
+        def record_scan(source_scan_id: int, new_scan_id: str) -> None:
+            with csv_lock:
+                append_scan_mapping(csvfile, source_scan_id, new_scan_id)
+        
+        # Start the checkpoint log from a snapshot, which also compacts a log replayed on resume
+        save_checkpoint(checkpoint_file, completed_batches, scan_mapping, total_failed_scans, csv_filename)
+        checkpoint_log = open(checkpoint_file, 'ab')
+        
+        # Files already copied or being copied by any batch of this run, so shared files are copied only once
+        uploaded_files_map = {}
+        in_flight_copies = InFlightCopies(uploaded_files_map)
+        
+        def finish_batch(batch_number: int, batch_source_scan_ids: list, future) -> None:
+            """Wait for a pipelined batch, then record its results and checkpoint it"""
+            nonlocal total_failed_scans, checkpoint_log
+            batch_new_scan_ids, batch_scan_mapping, batch_failed = future.result()
             
             # Print batch completion summary
-            print(f"\n{'='*80}", flush=True)
-            print(f"[BATCH {batch_number}/{total_batches}] Batch {batch_number} completed", flush=True)
-            print(f"[BATCH {batch_number}/{total_batches}] Source Scan IDs: {', '.join(map(str, batch_source_scan_ids))}", flush=True)
-            if batch_new_scan_ids:
-                print(f"[BATCH {batch_number}/{total_batches}] Created Target Scan IDs: {', '.join(map(str, batch_new_scan_ids))}", flush=True)
-            else:
-                print(f"[BATCH {batch_number}/{total_batches}] No scans created in this batch", flush=True)
-            print(f"[BATCH {batch_number}/{total_batches}] Success: {len(batch_new_scan_ids)}, Failed: {batch_failed}", flush=True)
-            print(f"{'='*80}\n", flush=True)
+            # The ID lists are only joined when INFO messages are shown
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("\n%s", BANNER)
+                logger.info("[BATCH %s/%s] Batch %s completed", batch_number, total_batches, batch_number)
+                logger.info("[BATCH %s/%s] Source Scan IDs: %s", batch_number, total_batches, ', '.join(map(str, batch_source_scan_ids)))
+                if batch_new_scan_ids:
+                    logger.info("[BATCH %s/%s] Created Target Scan IDs: %s", batch_number, total_batches, ', '.join(map(str, batch_new_scan_ids)))
+                else:
+                    logger.info("[BATCH %s/%s] No scans created in this batch", batch_number, total_batches)
+                logger.info("[BATCH %s/%s] Success: %s, Failed: %s", batch_number, total_batches, len(batch_new_scan_ids), batch_failed)
+                logger.info("%s\n", BANNER)
             
             # Update results
             new_scan_ids.extend(batch_new_scan_ids)
@@ -719,58 +1235,139 @@ def run(*,
             
             # Mark batch as completed and save checkpoint
             completed_batches.add(batch_number)
-            save_checkpoint(checkpoint_file, completed_batches, scan_mapping, total_failed_scans)
-            print(f"[CHECKPOINT] Progress saved: {len(completed_batches)}/{total_batches} batches completed", flush=True)
+            append_checkpoint(checkpoint_log, batch_number, batch_scan_mapping, batch_failed)
+            if len(completed_batches) % CHECKPOINT_COMPACT_EVERY == 0:
+                checkpoint_log.close()
+                save_checkpoint(checkpoint_file, completed_batches, scan_mapping, total_failed_scans, csv_filename)
+                checkpoint_log = open(checkpoint_file, 'ab')
+            logger.info("[CHECKPOINT] Progress saved: %s/%s batches completed", len(completed_batches), total_batches)
+        
+        # Worker threads live for the whole run and are shared by all batches and retries.
+        # The copy pool is sized for the largest adaptive copy concurrency
+        copy_executor = ThreadPoolExecutor(max_workers=MAX_FILE_WORKERS, thread_name_prefix='copy-file')
+        scan_executor = ThreadPoolExecutor(max_workers=MAX_SCAN_WORKERS, thread_name_prefix='create-scan')
+        # Up to BATCH_PIPELINE_DEPTH batches run at once, so the next batch is copying files and
+        # creating scans while the current one waits for its last requests. Results are still
+        # recorded in batch order
+        batch_executor = ThreadPoolExecutor(max_workers=BATCH_PIPELINE_DEPTH, thread_name_prefix='batch')
+        in_flight_batches = collections.deque()  # (batch_number, source scan IDs, future), oldest first
+        stop_event = threading.Event()
+        try:
+            # Process batches
+            total_batches = (total_scans + batch_size - 1) // batch_size
+            scans_seen = 0
+            for batch_start, batch_scans in iter_batches(scans_info, batch_size):
+                batch_number = (batch_start // batch_size) + 1
+                scans_seen = batch_start + len(batch_scans)
+                
+                # Skip if batch already completed
+                if batch_number in completed_batches:
+                    logger.info("\n%s", BANNER)
+                    logger.info("[BATCH %s/%s] Already completed, skipping...", batch_number, total_batches)
+                    logger.info("%s\n", BANNER)
+                    continue
+                
+                batch_count = len(batch_scans)
+                
+                # Extract source scan IDs for this batch
+                batch_source_scan_ids = [scan_info['id'] for scan_info in batch_scans]
+                
+                # Leave out scans an earlier run already created
+                batch_scans = [scan_info for scan_info in batch_scans if scan_info['id'] not in copied_source_scan_ids]
+                if len(batch_scans) < batch_count:
+                    logger.info("[RESUME] Skipping %s scans of batch %s that were already copied", batch_count - len(batch_scans), batch_number)
+                
+                # Print batch start with scan IDs
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("\n%s", BANNER)
+                    logger.info("[BATCH %s/%s] Starting batch %s", batch_number, total_batches, batch_number)
+                    logger.info("[BATCH %s/%s] Processing scans %s-%s of %s", batch_number, total_batches, batch_start + 1, batch_start + batch_count, total_scans)
+                    logger.info("[BATCH %s/%s] Source Scan IDs: %s", batch_number, total_batches, ', '.join(map(str, batch_source_scan_ids)))
+                    logger.info("%s\n", BANNER)
+                
+                # Process batch with retry logic
+                future = batch_executor.submit(
+                    process_batch_with_retry,
+                    batch_number=batch_number,
+                    batch_scans=batch_scans,
+                    batch_start=batch_start,
+                    total_scans=total_scans,
+                    from_instance=from_instance,
+                    to_instance=to_instance,
+                    auth_token_1=auth_token_1,
+                    auth_token_2=auth_token_2,
+                    target_store_id=target_store_id,
+                    captured_at=captured_at,
+                    max_batch_retries=batch_retries,
+                    on_scan_created=record_scan,
+                    uploaded_files_map=uploaded_files_map,
+                    in_flight_copies=in_flight_copies,
+                    copy_executor=copy_executor,
+                    scan_executor=scan_executor,
+                    stop_event=stop_event
+                )
+                in_flight_batches.append((batch_number, batch_source_scan_ids, future))
+                if len(in_flight_batches) >= BATCH_PIPELINE_DEPTH:
+                    finish_batch(*in_flight_batches.popleft())
+            while in_flight_batches:
+                finish_batch(*in_flight_batches.popleft())
+        finally:
+            # Batches still running when the run stops give up instead of retrying
+            stop_event.set()
+            batch_executor.shutdown(wait=False, cancel_futures=True)
+            copy_executor.shutdown(cancel_futures=True)
+            scan_executor.shutdown(cancel_futures=True)
+            batch_executor.shutdown()
+            scans_info.close()
+            csvfile.close()
+            checkpoint_log.close()
+        
+        if scans_seen < total_scans:
+            logger.warning("[WARNING] %s requested scan IDs were not found in %s", total_scans - scans_seen, from_instance)
+        total_scans = scans_seen
         
-        print(f"[SUCCESS] Created {len(new_scan_ids)} scans successfully across all batches")
+        logger.info("[SUCCESS] Created %s scans successfully across all batches", len(new_scan_ids))
         total_attempted_scans = total_scans - total_failed_scans
         success_rate = (len(new_scan_ids) / total_attempted_scans * 100) if total_attempted_scans > 0 else 0
-        print(f"[STATS] Success rate: {len(new_scan_ids)}/{total_attempted_scans} ({success_rate:.1f}%)")
-        print(f"[STATS] Failed scans: {total_failed_scans}")
+        logger.info("[STATS] Success rate: %s/%s (%.1f%%)", len(new_scan_ids), total_attempted_scans, success_rate)
+        logger.info("[STATS] Failed scans: %s", total_failed_scans)
 
-        if new_scan_ids:
-            print('All new scans:', ', '.join(map(str, new_scan_ids)))
-        else:
-            print("[WARNING] No scans were created successfully!")
+        if not new_scan_ids:
+            logger.warning("[WARNING] No scans were created successfully!")
+        elif logger.isEnabledFor(logging.INFO):
+            logger.info('All new scans: %s', ', '.join(map(str, new_scan_ids)))
         
-        # Create CSV file with scan ID mapping
-        csv_filename = f"scan_mapping_updated_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        print(f'Creating CSV file: {csv_filename}')
-        
-        with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['Source_Scan_ID', 'Target_Scan_ID'])
-            writer.writerows(scan_mapping)
-        
-        print(f'CSV file created successfully: {csv_filename}')
+        logger.info('CSV file created successfully: %s', csv_filename)
         
         # Clean up checkpoint file on successful completion
         if resume and os.path.exists(checkpoint_file):
             try:
                 os.remove(checkpoint_file)
-                print(f'[CHECKPOINT] Cleaned up checkpoint file: {checkpoint_file}')
+                logger.info('[CHECKPOINT] Cleaned up checkpoint file: %s', checkpoint_file)
             except Exception as e:
-                print(f'[WARNING] Could not remove checkpoint file: {e}')
+                logger.warning('[WARNING] Could not remove checkpoint file: %s', e)
         
-        print('Script completed successfully!')
+        logger.info('Script completed successfully!')
         
     except Exception as e:
-        print(f"Error occurred: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error occurred: %s", e)
 
 
 if __name__ == "__main__":
-    run(
-        from_instance=SOURCE_INSTANCE,
-        to_instance=TARGET_INSTANCE,
-        source_username=SOURCE_USERNAME,
-        source_password=SOURCE_PASSWORD,
-        target_username=TARGET_USERNAME,
-        target_password=TARGET_PASSWORD,
-        first_db_password=SOURCE_DB_PASSWORD,
-        second_db_password=TARGET_DB_PASSWORD,
-        scan_ids_for_copying=SCAN_IDS_FOR_COPYING,
-        captured_at=int(datetime.datetime.now().timestamp()),
-        target_store_id=TARGET_STORE_ID,
-    )
+    log_listener = setup_logging()
+    try:
+        run(
+            from_instance=SOURCE_INSTANCE,
+            to_instance=TARGET_INSTANCE,
+            source_username=SOURCE_USERNAME,
+            source_password=SOURCE_PASSWORD,
+            target_username=TARGET_USERNAME,
+            target_password=TARGET_PASSWORD,
+            first_db_password=SOURCE_DB_PASSWORD,
+            second_db_password=TARGET_DB_PASSWORD,
+            scan_ids_for_copying=SCAN_IDS_FOR_COPYING,
+            captured_at=int(datetime.datetime.now().timestamp()),
+            target_store_id=TARGET_STORE_ID,
+        )
+    finally:
+        log_listener.stop()
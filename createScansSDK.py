@@ -32,11 +32,11 @@ class CreateScansSDK:
         if self.checkpoint_prompt_shown:
             return
 
-        checkpoint_files = glob.glob("checkpoint_*.json")
+        checkpoint_files = glob.glob("checkpoint_*.log")
         if not checkpoint_files:
             return
 
-        latest_checkpoint = max(checkpoint_files, key=os.path.getmtime)
+        latest_checkpoint = max(checkpoint_files)  # checkpoint_<timestamp>.log sorts by age
         print("\n" + "=" * 80)
         print("Checkpoint detected!")
         print(f"Latest checkpoint file: {latest_checkpoint}")
@@ -1011,18 +1011,11 @@ class CreateScansSDK:
         
         try:
             # Import the scan data analysis function
-            from scanDataAnalysis import get_scan_data, check_additional_sections, process_scan_data, create_detailed_csv_report
+            from scanDataAnalysis import get_scan_data_with_sections, process_scan_data, create_detailed_csv_report
             
-            # Get source data
+            # Get source data and additional sections data in one round trip
             print("🔄 Getting source scan data...")
-            source_data = get_scan_data(
-                self.config['SOURCE_INSTANCE'], 
-                self.config['SOURCE_DB_PASSWORD'], 
-                tuple(self.source_scan_ids)
-            )
-            
-            # Get additional sections data
-            additional_sections_data = check_additional_sections(
+            source_data, additional_sections_data = get_scan_data_with_sections(
                 self.config['SOURCE_INSTANCE'], 
                 self.config['SOURCE_DB_PASSWORD'], 
                 tuple(self.source_scan_ids)
@@ -1035,13 +1028,7 @@ class CreateScansSDK:
             processed_target_data = []
             if self.target_scan_ids:
                 print("🔄 Getting target scan data...")
-                target_data = get_scan_data(
-                    self.config['TARGET_INSTANCE'], 
-                    self.config['TARGET_DB_PASSWORD'], 
-                    tuple(self.target_scan_ids)
-                )
-                
-                target_additional_sections_data = check_additional_sections(
+                target_data, target_additional_sections_data = get_scan_data_with_sections(
                     self.config['TARGET_INSTANCE'], 
                     self.config['TARGET_DB_PASSWORD'], 
                     tuple(self.target_scan_ids)
@@ -4,12 +4,28 @@ import os
 import sys
 import io
 import argparse
-from functools import cache
+import json
+import itertools
+import shutil
+import tarfile
+import tempfile
+import threading
+import queue
+import logging
+import logging.handlers
+from functools import lru_cache
 import psycopg
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the standard json module
+    orjson = None
 from psycopg.rows import dict_row
+from psycopg.types.json import set_json_loads
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from config import *
 
 # Fix Windows console encoding to support Unicode characters
@@ -17,7 +33,49 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
-def run_sql(sql: str, *, instance_name: str, db_password: str) -> typing.Any:
+logger = logging.getLogger(__name__)
+
+BANNER = '=' * 80
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Route log records through a queue to a single writer thread, so download threads never wait on stdout.
+    The caller stops the returned listener to flush remaining records on exit."""
+    log_queue = queue.SimpleQueue()
+    # QueueHandler formats the message before queueing it; the writer thread only prints it
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), handlers=[queue_handler])
+    listener.start()
+    return listener
+
+MAX_DOWNLOAD_WORKERS = 20
+# Downloads queued on the pool at any one time; the rest wait in the batch's file list
+MAX_IN_FLIGHT = MAX_DOWNLOAD_WORKERS * 2
+
+# One keep-alive session shared by all download threads. Requests only go to the API host and the storage host,
+# and each host's pool is sized from the worker count so connections are reused instead of being
+# discarded with "Connection pool is full" warnings
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = MAX_DOWNLOAD_WORKERS * 2
+
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=POOL_CONNECTIONS,
+    pool_maxsize=POOL_MAXSIZE,
+    pool_block=False,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+))
+
+def load_json(content: bytes) -> typing.Any:
+    """Parse a JSON response body, with orjson when it is installed. Raises ValueError on invalid JSON."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def stream_sql(sql: str, params: typing.Optional[typing.Sequence] = None, *, instance_name: str, db_password: str, itersize: int = 100) -> typing.Iterator[dict]:
+    """Yield rows from a server-side cursor, fetched from the server itersize rows at a time.
+    The connection stays open until the generator is exhausted or closed."""
     with psycopg.connect(
             user='proxyuser',
             password=db_password,
@@ -26,143 +84,230 @@ def run_sql(sql: str, *, instance_name: str, db_password: str) -> typing.Any:
             dbname=instance_name,
             row_factory=dict_row
     ) as connection:
-        with connection.cursor() as cursor:
-            cursor.execute(sql)
-            return tuple(cursor.fetchall())
+        if orjson is not None:
+            # provided_values and scan_files are jsonb; decode them with orjson on this connection only
+            set_json_loads(orjson.loads, connection)
+        with connection.cursor(name='stream_sql') as cursor:
+            cursor.itersize = itersize
+            cursor.execute(sql, params)
+            yield from cursor
+
+def iter_batches(rows: typing.Iterable, batch_size: int) -> typing.Iterator[tuple[int, list]]:
+    """Yield (offset, rows) chunks of at most batch_size rows, reading rows lazily"""
+    rows = iter(rows)
+    batch_start = 0
+    while batch := list(itertools.islice(rows, batch_size)):
+        yield batch_start, batch
+        batch_start += len(batch)
 
-@cache
 def get_auth_token(instance_name: str, username: str, password: str) -> tuple[str, str]:
-    response = requests.post(f'https://{instance_name}.rebotics.net/api/v4/token-auth/', json={
+    response = _SESSION.post(f'https://{instance_name}.rebotics.net/api/v4/token-auth/', json={
         'username': username,
         'password': password,
     }, timeout=30)
     response.raise_for_status()
-    raw_data = response.json()
+    raw_data = load_json(response.content)
     
     if raw_data is None:
-        print(f"[AUTH] [ERROR] API returned None response for token auth!", flush=True)
+        logger.error("[AUTH] [ERROR] API returned None response for token auth!")
         raise ValueError("API returned None response for token auth")
     
     if 'id' not in raw_data or 'token' not in raw_data:
-        print(f"[AUTH] [ERROR] API response missing required fields!", flush=True)
+        logger.error("[AUTH] [ERROR] API response missing required fields!")
         raise ValueError(f"API response missing required fields. Response: {raw_data}")
     
     return raw_data['id'], raw_data['token']
 
 SQL_FOR_GETTING_INFO_ABOUT_SCANS = """
-SELECT DISTINCT ON ("realograms_implementation_scan"."id")
+SELECT
 "realograms_implementation_scan"."id",
 "realograms_implementation_scan"."provided_values",
-jsonb_build_array((
-  SELECT jsonb_build_object('file_id', U0."file_id", 'type', U0."file_type") AS "a"
-  FROM "realograms_implementation_scanfile" U0
-  WHERE U0."scan_id" = "realograms_implementation_scan"."id"
-)) AS "scan_files",
+COALESCE("files"."scan_files", '[]'::jsonb) AS "scan_files",
 "master_data_implementation_category"."name" AS "selected_category_name",
 "realograms_implementation_scan"."selected_category_id" AS "category_id",
-"planograms_compliance_planogramcompliancereport"."section_name" AS "section_name"
+"report"."section_name" AS "section_name"
 FROM "realograms_implementation_scan"
+LEFT JOIN LATERAL (
+  SELECT jsonb_agg(jsonb_build_object('file_id', U0."file_id", 'type', U0."file_type")) AS "scan_files"
+  FROM "realograms_implementation_scanfile" U0
+  WHERE U0."scan_id" = "realograms_implementation_scan"."id"
+) "files" ON true
 LEFT OUTER JOIN "master_data_implementation_category"
 ON ("realograms_implementation_scan"."selected_category_id" = "master_data_implementation_category"."id")
-LEFT OUTER JOIN "realograms_implementation_realogram"
-ON ("realograms_implementation_scan"."active_realogram_id" = "realograms_implementation_realogram"."id")
-LEFT OUTER JOIN "planograms_compliance_planogramcompliancereport"
-ON ("realograms_implementation_realogram"."id" = "planograms_compliance_planogramcompliancereport"."realogram_id")
-WHERE "realograms_implementation_scan"."id" IN ({})
-ORDER BY "realograms_implementation_scan"."id", "planograms_compliance_planogramcompliancereport"."id" NULLS LAST;
+LEFT JOIN LATERAL (
+  SELECT U1."section_name"
+  FROM "planograms_compliance_planogramcompliancereport" U1
+  WHERE U1."realogram_id" = "realograms_implementation_scan"."active_realogram_id"
+  ORDER BY U1."id"
+  LIMIT 1
+) "report" ON true
+WHERE "realograms_implementation_scan"."id" = ANY(%s)
+ORDER BY "realograms_implementation_scan"."id";
 """
 
-def get_info_about_scans(scan_ids: typing.Sequence[int], *, instance_name: str, db_password: str) -> tuple[dict]:
-    return run_sql(
-        SQL_FOR_GETTING_INFO_ABOUT_SCANS.format(','.join(map(str, scan_ids))),
+def get_info_about_scans(scan_ids: typing.Sequence[int], *, instance_name: str, db_password: str) -> typing.Iterator[dict]:
+    """Stream scan info rows ordered by scan ID, so batches are the same on every run"""
+    return stream_sql(
+        SQL_FOR_GETTING_INFO_ABOUT_SCANS,
+        (list(scan_ids),),
         instance_name=instance_name,
         db_password=db_password,
     )
 
-def download_file(file_id: int, *, instance_name: str, auth_token: str) -> tuple[str, bytes]:
-    """Download file from API and return filename and content"""
-    response = requests.get(
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+SPOOL_MAX_SIZE = 8 << 20  # Files packed into a tar are held in memory up to this size, then spill to a temp file
+
+class TarPacker:
+    """Write downloaded files into one uncompressed tar stream from a single writer thread.
+    Download threads hand over finished files with add(); close() waits for the writer and closes the archive."""
+
+    def __init__(self, tar_path: str, max_pending: int = MAX_DOWNLOAD_WORKERS):
+        self._tar = tarfile.open(tar_path, 'w|')
+        # Bounded so downloads pause instead of piling up spooled files when the disk is slower than the network
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._error: typing.Optional[BaseException] = None
+        self._writer = threading.Thread(target=self._write_all, name='tar-writer', daemon=True)
+        self._writer.start()
+
+    def add(self, name: str, fileobj: typing.BinaryIO) -> None:
+        """Queue a file for the archive; the writer closes fileobj once it has been written"""
+        if self._error is not None:
+            fileobj.close()
+            raise RuntimeError(f"Tar writer failed: {self._error}")
+        self._pending.put((name, fileobj))
+
+    def _write_all(self) -> None:
+        while (item := self._pending.get()) is not None:
+            name, fileobj = item
+            try:
+                if self._error is None:
+                    info = tarfile.TarInfo(name)
+                    info.size = fileobj.seek(0, os.SEEK_END)
+                    info.mtime = int(time.time())
+                    fileobj.seek(0)
+                    self._tar.addfile(info, fileobj)
+            except Exception as e:
+                # Keep draining the queue so download threads never block on a dead writer
+                self._error = e
+                logger.error("[TAR] [ERROR] Failed to write %s: %s", name, e)
+            finally:
+                fileobj.close()
+
+    def close(self) -> None:
+        self._pending.put(None)
+        self._writer.join()
+        self._tar.close()
+        if self._error is not None:
+            raise RuntimeError(f"Tar writer failed: {self._error}")
+
+def download_file(file_id: int, save_path: str, *, instance_name: str, auth_token: str,
+                  packer: typing.Optional[TarPacker] = None) -> str:
+    """Download file from API straight to save_path, or into the tar archive when a packer is given,
+    and return its original filename"""
+    response = _SESSION.get(
         f'https://{instance_name}.rebotics.net/api/v1/master-data/file-upload/{file_id}/',
         headers={'Authorization': f'Token {auth_token}'},
         timeout=60
     )
     response.raise_for_status()
-    raw_data = response.json()
+    raw_data = load_json(response.content)
     
     if raw_data is None:
-        print(f"[DOWNLOAD] [ERROR] API returned None response for file {file_id}!", flush=True)
+        logger.error("[DOWNLOAD] [ERROR] API returned None response for file %s!", file_id)
         raise ValueError(f"API returned None response for file {file_id}")
     
     if 'file' not in raw_data or 'original_filename' not in raw_data:
-        print(f"[DOWNLOAD] [ERROR] API response missing required fields for file {file_id}!", flush=True)
+        logger.error("[DOWNLOAD] [ERROR] API response missing required fields for file %s!", file_id)
         raise ValueError(f"API response missing required fields. Response: {raw_data}")
     
     file_url, file_name = raw_data['file'], raw_data['original_filename']
     
-    response = requests.get(file_url, timeout=120)
-    response.raise_for_status()
+    # Stream the body to disk chunk by chunk so only one chunk per thread is held in memory.
+    # Reading the raw stream in 1 MB blocks into an unbuffered file makes one write() per block
+    with _SESSION.get(file_url, stream=True, timeout=120) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        if packer is None:
+            # The body goes to a temp file next to save_path and is only renamed into place once complete,
+            # so a dropped connection never leaves a truncated image under the final name
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(save_path) or '.', prefix='.download-', suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb', buffering=0) as f:
+                    shutil.copyfileobj(response.raw, f, DOWNLOAD_CHUNK_SIZE)
+                os.replace(tmp_path, save_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        else:
+            spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+            try:
+                shutil.copyfileobj(response.raw, spool, DOWNLOAD_CHUNK_SIZE)
+            except BaseException:
+                spool.close()
+                raise
+            packer.add(os.path.basename(save_path), spool)
     
-    return file_name, response.content
+    return file_name
 
-def download_file_threaded(file_id: int, file_name: str, save_path: str, instance_name: str, auth_token: str) -> tuple[int, str]:
+def download_file_threaded(file_id: int, save_path: str, instance_name: str, auth_token: str,
+                           packer: typing.Optional[TarPacker] = None) -> tuple[int, str]:
     """Thread-safe wrapper for download_file function"""
     try:
-        _, file_content = download_file(file_id, instance_name=instance_name, auth_token=auth_token)
-        
-        # Save file to disk
-        with open(save_path, 'wb') as f:
-            f.write(file_content)
-        
+        download_file(file_id, save_path, instance_name=instance_name, auth_token=auth_token, packer=packer)
         return file_id, save_path
     except Exception as e:
-        print(f"[ERROR] [Thread] Error downloading file {file_id} to {save_path}: {e}", flush=True)
+        logger.error("[ERROR] [Thread] Error downloading file %s to %s: %s", file_id, save_path, e)
         raise
 
+_SANITIZE_TABLE = str.maketrans(dict.fromkeys('<>:"/\\|?*', '_'))
+
 def sanitize_filename(filename: str) -> str:
     """Sanitize filename to remove invalid characters"""
-    invalid_chars = '<>:"/\\|?*'
-    for char in invalid_chars:
-        filename = filename.replace(char, '_')
-    # Remove leading/trailing spaces and dots
-    filename = filename.strip('. ')
-    return filename
+    # Replace invalid characters in one pass, then remove leading/trailing spaces and dots
+    return filename.translate(_SANITIZE_TABLE).strip('. ')
+
+@lru_cache(maxsize=1024)
+def _file_ext(original_filename: str) -> str:
+    """Extension of an original filename, '.jpg' when it has none; scans repeat the same few values"""
+    return os.path.splitext(original_filename)[1] or '.jpg'
 
 def generate_filename(scan_id: int, section_name: typing.Optional[str], 
-                     store_pog_id: typing.Optional[int], original_filename: str) -> str:
+                     store_pog_id: typing.Optional[int], original_filename: str,
+                     file_index: typing.Optional[int] = None) -> str:
     """Generate filename with format: scan_id_section_name_storepog_id.ext
-    If no section and store POG, then: scan_id.ext"""
-    # Get file extension from original filename
-    file_ext = os.path.splitext(original_filename)[1] or '.jpg'
-    
-    # Build filename parts
-    parts = []
-    
-    # Always add scan ID first
-    parts.append(str(scan_id))
-    
-    # Add section name if available
-    if section_name:
-        sanitized_section = sanitize_filename(str(section_name))
-        parts.append(sanitized_section)
-    
-    # Add store POG ID if available
-    if store_pog_id:
-        parts.append(str(store_pog_id))
-    
-    # Join parts and add extension
-    filename = "_".join(parts) + file_ext
-    
-    return filename
+    If no section and store POG, then: scan_id.ext
+    file_index is appended (scan_id_..._N.ext) for scans with more than one file, so every file gets its own name"""
+    # Section name, store POG ID and file index are only added when available
+    section_part = f"_{sanitize_filename(str(section_name))}" if section_name else ''
+    store_pog_part = f"_{store_pog_id}" if store_pog_id else ''
+    index_part = f"_{file_index}" if file_index is not None else ''
+    return f"{scan_id}{section_part}{store_pog_part}{index_part}{_file_ext(original_filename)}"
+
+def _extract_store_pog_id(provided_values: typing.Any) -> typing.Optional[int]:
+    """Store POG ID from a scan's provided_values, preferring the _raw_data payload when present"""
+    if not isinstance(provided_values, dict):
+        return None
+    raw_data = provided_values.get('_raw_data')
+    if isinstance(raw_data, dict):
+        source = raw_data
+    elif 'store_planogram' in provided_values:
+        source = provided_values
+    else:
+        return None
+    # Try different possible field names for store POG ID
+    return source.get('store_planogram') or source.get('store_planogram_id')
 
 def process_batch_downloads(
     batch_number: int,
     batch_scans: list,
     download_folder: str,
     instance_name: str,
-    auth_token: str
+    auth_token: str,
+    executor: ThreadPoolExecutor,
+    packer: typing.Optional[TarPacker] = None
 ) -> tuple[int, int]:
     """
-    Process a single batch of downloads.
+    Process a single batch of downloads on the shared executor.
     Returns: (successful_downloads, failed_downloads)
     """
     successful_downloads = 0
@@ -176,25 +321,14 @@ def process_batch_downloads(
         scan_files = scan_info.get('scan_files', [])
         provided_values = scan_info.get('provided_values')
         
-        # Extract store POG ID from provided_values
-        store_pog_id = None
-        if provided_values:
-            try:
-                if isinstance(provided_values, dict):
-                    # Check if _raw_data exists
-                    if '_raw_data' in provided_values and isinstance(provided_values['_raw_data'], dict):
-                        raw_data = provided_values['_raw_data']
-                        # Try different possible field names for store POG ID
-                        store_pog_id = raw_data.get('store_planogram') or raw_data.get('store_planogram_id')
-                    elif 'store_planogram' in provided_values:
-                        store_pog_id = provided_values.get('store_planogram') or provided_values.get('store_planogram_id')
-            except Exception as e:
-                print(f"[BATCH {batch_number}] [WARNING] Error extracting store POG ID for scan {source_scan_id}: {e}", flush=True)
+        store_pog_id = _extract_store_pog_id(provided_values)
         
         if not scan_files or scan_files is None:
-            print(f"[BATCH {batch_number}] [WARNING] No scan_files for scan {source_scan_id}, skipping", flush=True)
+            logger.warning("[BATCH %s] [WARNING] No scan_files for scan %s, skipping", batch_number, source_scan_id)
             continue
         
+        # Scans with several files number them, otherwise they would all get the same name
+        numbered = len(scan_files) > 1
         for file_index, scan_file in enumerate(scan_files, 1):
             if not scan_file or 'file_id' not in scan_file:
                 continue
@@ -207,41 +341,51 @@ def process_batch_downloads(
                 scan_id=source_scan_id,
                 section_name=section_name,
                 store_pog_id=store_pog_id,
-                original_filename=original_filename
+                original_filename=original_filename,
+                file_index=file_index if numbered else None
             )
             
             save_path = os.path.join(download_folder, filename)
             files_to_download.append((file_id, filename, save_path, source_scan_id))
     
     if not files_to_download:
-        print(f"[BATCH {batch_number}] No files to download in this batch", flush=True)
+        logger.info("[BATCH %s] No files to download in this batch", batch_number)
         return 0, 0
     
-    print(f"[BATCH {batch_number}] Starting download of {len(files_to_download)} files", flush=True)
+    logger.info("[BATCH %s] Starting download of %s files", batch_number, len(files_to_download))
     
-    # Download files with threading
-    max_workers = min(20, len(files_to_download))
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        download_futures = {
-            executor.submit(download_file_threaded, file_id, filename, save_path, instance_name, auth_token): (file_id, source_scan_id)
-            for file_id, filename, save_path, source_scan_id in files_to_download
-        }
-        
-        completed_downloads = 0
-        for future in as_completed(download_futures):
+    # Download files on the run-wide pool so worker threads and their connections stay warm between batches.
+    # Only MAX_IN_FLIGHT downloads are submitted ahead of completion, keeping the number of live futures bounded
+    in_flight = {}
+    completed_downloads = 0
+    
+    def collect(done) -> None:
+        nonlocal successful_downloads, failed_downloads, completed_downloads
+        for future in done:
+            file_id, source_scan_id = in_flight.pop(future)
             try:
-                file_id, saved_path = future.result()
+                future.result()
                 successful_downloads += 1
                 completed_downloads += 1
                 
                 if completed_downloads % max(1, min(50, len(files_to_download) // 10)) == 0 or completed_downloads == len(files_to_download):
-                    print(f"[BATCH {batch_number}] [DOWNLOAD] {completed_downloads}/{len(files_to_download)} ({completed_downloads*100//len(files_to_download)}%)", flush=True)
+                    logger.info("[BATCH %s] [DOWNLOAD] %s/%s (%s%%)", batch_number, completed_downloads, len(files_to_download), completed_downloads*100//len(files_to_download))
             except Exception as e:
-                file_id, source_scan_id = download_futures[future]
                 failed_downloads += 1
-                print(f"[BATCH {batch_number}] [ERROR] Failed to download file {file_id} for scan {source_scan_id}: {e}", flush=True)
+                logger.error("[BATCH %s] [ERROR] Failed to download file %s for scan %s: %s", batch_number, file_id, source_scan_id, e)
     
-    print(f"[BATCH {batch_number}] Downloaded {successful_downloads}/{len(files_to_download)} files successfully", flush=True)
+    for file_id, filename, save_path, source_scan_id in files_to_download:
+        if len(in_flight) >= MAX_IN_FLIGHT:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+        future = executor.submit(download_file_threaded, file_id, save_path, instance_name, auth_token, packer)
+        in_flight[future] = (file_id, source_scan_id)
+    
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        collect(done)
+    
+    logger.info("[BATCH %s] Downloaded %s/%s files successfully", batch_number, successful_downloads, len(files_to_download))
     return successful_downloads, failed_downloads
 
 def run(*,
@@ -251,74 +395,112 @@ def run(*,
         source_password: str,
         scan_ids_for_downloading: typing.Sequence[int],
         download_folder: str,
-        batch_size: int = 10) -> None:
+        batch_size: int = 10,
+        pack_tar: typing.Optional[str] = None) -> None:
     try:
-        print('Obtaining authentication token...', flush=True)
-        _, auth_token = get_auth_token(from_instance, source_username, source_password)
-        print(f"Auth token obtained for {from_instance}", flush=True)
+        logger.info('Obtaining authentication token...')
+        # Login runs in the background while the scan query starts; the token is only needed once files are submitted
+        auth_executor = ThreadPoolExecutor(max_workers=1)
+        auth_future = auth_executor.submit(get_auth_token, from_instance, source_username, source_password)
+        auth_executor.shutdown(wait=False)
         
-        print('Getting info about scans...', flush=True)
+        logger.info('Getting info about scans...')
+        # Rows are streamed and downloaded batch by batch, so downloads start before the query has finished
         scans_info = get_info_about_scans(scan_ids_for_downloading, instance_name=from_instance, db_password=first_db_password)
-        print(f"Retrieved info for {len(scans_info)} scans", flush=True)
+        total_scans = len(set(scan_ids_for_downloading))  # Upper bound; IDs missing from the source return no row
+        logger.info("Streaming info for up to %s scans", total_scans)
         
-        # Create download folder if it doesn't exist
-        if not os.path.exists(download_folder):
-            os.makedirs(download_folder, exist_ok=True)
-            print(f"Created download folder: {download_folder}", flush=True)
+        if pack_tar:
+            # Files go into a single archive instead of the download folder
+            packer = TarPacker(pack_tar)
+            logger.info("Packing images into tar archive: %s", pack_tar)
         else:
-            print(f"Using existing download folder: {download_folder}", flush=True)
+            packer = None
+            # Create download folder if it doesn't exist
+            os.makedirs(download_folder, exist_ok=True)
+            logger.info("Using download folder: %s", download_folder)
         
-        total_scans = len(scans_info)
-        print(f"[BATCH] Processing scans in groups of {batch_size} (total scans: {total_scans})", flush=True)
+        logger.info("[BATCH] Processing scans in groups of %s (total scans: %s)", batch_size, total_scans)
         
         total_successful = 0
         total_failed = 0
         
-        # Process batches
-        total_batches = (total_scans + batch_size - 1) // batch_size
-        for batch_start in range(0, total_scans, batch_size):
-            batch_number = (batch_start // batch_size) + 1
-            batch_scans = scans_info[batch_start:batch_start + batch_size]
-            batch_count = len(batch_scans)
-            
-            # Extract source scan IDs for this batch
-            batch_source_scan_ids = [scan_info.get('id') for scan_info in batch_scans if scan_info.get('id')]
-            
-            # Print batch start with scan IDs
-            print(f"\n{'='*80}", flush=True)
-            print(f"[BATCH {batch_number}/{total_batches}] Starting batch {batch_number}", flush=True)
-            print(f"[BATCH {batch_number}/{total_batches}] Processing scans {batch_start + 1}-{batch_start + batch_count} of {total_scans}", flush=True)
-            print(f"[BATCH {batch_number}/{total_batches}] Source Scan IDs: {', '.join(map(str, batch_source_scan_ids))}", flush=True)
-            print(f"{'='*80}\n", flush=True)
-            
-            # Process batch downloads
-            successful, failed = process_batch_downloads(
-                batch_number=batch_number,
-                batch_scans=batch_scans,
-                download_folder=download_folder,
-                instance_name=from_instance,
-                auth_token=auth_token
-            )
-            
-            total_successful += successful
-            total_failed += failed
-            
-            # Print batch completion summary
-            print(f"\n{'='*80}", flush=True)
-            print(f"[BATCH {batch_number}/{total_batches}] Batch {batch_number} completed", flush=True)
-            print(f"[BATCH {batch_number}/{total_batches}] Source Scan IDs: {', '.join(map(str, batch_source_scan_ids))}", flush=True)
-            print(f"[BATCH {batch_number}/{total_batches}] Success: {successful}, Failed: {failed}", flush=True)
-            print(f"{'='*80}\n", flush=True)
+        archive_finished = False
+        try:
+            # Process batches
+            # One pool for the whole run: threads and their keep-alive connections are reused across batches
+            with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as executor:
+                total_batches = (total_scans + batch_size - 1) // batch_size
+                scans_seen = 0
+                auth_token = None
+                try:
+                    for batch_start, batch_scans in iter_batches(scans_info, batch_size):
+                        batch_number = (batch_start // batch_size) + 1
+                        batch_count = len(batch_scans)
+                        scans_seen = batch_start + batch_count
+                        
+                        if auth_token is None:
+                            _, auth_token = auth_future.result()
+                            logger.info("Auth token obtained for %s", from_instance)
+                        
+                        # Extract source scan IDs for this batch
+                        batch_source_scan_ids = [scan_info.get('id') for scan_info in batch_scans if scan_info.get('id')]
+                        
+                        # Print batch start with scan IDs
+                        logger.info("\n%s", BANNER)
+                        logger.info("[BATCH %s/%s] Starting batch %s", batch_number, total_batches, batch_number)
+                        logger.info("[BATCH %s/%s] Processing scans %s-%s of %s", batch_number, total_batches, batch_start + 1, batch_start + batch_count, total_scans)
+                        logger.info("[BATCH %s/%s] Source Scan IDs: %s", batch_number, total_batches, ', '.join(map(str, batch_source_scan_ids)))
+                        logger.info("%s\n", BANNER)
+                        
+                        # Process batch downloads
+                        successful, failed = process_batch_downloads(
+                            batch_number=batch_number,
+                            batch_scans=batch_scans,
+                            download_folder=download_folder,
+                            instance_name=from_instance,
+                            auth_token=auth_token,
+                            executor=executor,
+                            packer=packer
+                        )
+                        
+                        total_successful += successful
+                        total_failed += failed
+                        
+                        # Print batch completion summary
+                        logger.info("\n%s", BANNER)
+                        logger.info("[BATCH %s/%s] Batch %s completed", batch_number, total_batches, batch_number)
+                        logger.info("[BATCH %s/%s] Source Scan IDs: %s", batch_number, total_batches, ', '.join(map(str, batch_source_scan_ids)))
+                        logger.info("[BATCH %s/%s] Success: %s, Failed: %s", batch_number, total_batches, successful, failed)
+                        logger.info("%s\n", BANNER)
+                finally:
+                    scans_info.close()
+            archive_finished = True
+        finally:
+            # The archive gets its end-of-archive blocks and the writer thread stops even when the run fails
+            if packer is not None:
+                try:
+                    packer.close()
+                except Exception:
+                    if archive_finished:
+                        raise
+                    # Keep the error that stopped the run; only report the one from closing the archive
+                    logger.exception("[WARNING] Could not finish tar archive %s", pack_tar)
+        
+        # With no batch the token was never read; a failed login must still fail the run
+        if auth_token is None:
+            auth_future.result()
+        
+        if scans_seen < total_scans:
+            logger.warning("[WARNING] %s requested scan IDs were not found in %s", total_scans - scans_seen, from_instance)
         
-        print(f"[SUCCESS] Downloaded {total_successful} files successfully across all batches", flush=True)
-        print(f"[STATS] Failed downloads: {total_failed}", flush=True)
-        print(f"[STATS] Download folder: {download_folder}", flush=True)
-        print('Script completed successfully!', flush=True)
+        logger.info("[SUCCESS] Downloaded %s files successfully across all batches", total_successful)
+        logger.info("[STATS] Failed downloads: %s", total_failed)
+        logger.info("[STATS] %s: %s", 'Tar archive' if pack_tar else 'Download folder', pack_tar or download_folder)
+        logger.info('Script completed successfully!')
         
     except Exception as e:
-        print(f"Error occurred: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error occurred: %s", e)
 
 
 if __name__ == "__main__":
@@ -328,6 +510,8 @@ if __name__ == "__main__":
                         help='Folder path to download images (default: ./downloaded_images)')
     parser.add_argument('--batch-size', type=int, default=10,
                         help='Number of scans to process per batch (default: 10)')
+    parser.add_argument('--pack-tar', type=str, default=None, metavar='PATH',
+                        help='Write all images into one uncompressed tar archive at PATH instead of the download folder')
     
     args = parser.parse_args()
     
@@ -343,13 +527,17 @@ if __name__ == "__main__":
     # Convert to absolute path
     download_folder = os.path.abspath(download_folder)
     
-    run(
-        from_instance=SOURCE_INSTANCE,
-        first_db_password=SOURCE_DB_PASSWORD,
-        source_username=SOURCE_USERNAME,
-        source_password=SOURCE_PASSWORD,
-        scan_ids_for_downloading=SCAN_IDS_FOR_COPYING,
-        download_folder=download_folder,
-        batch_size=args.batch_size,
-    )
-
+    log_listener = setup_logging()
+    try:
+        run(
+            from_instance=SOURCE_INSTANCE,
+            first_db_password=SOURCE_DB_PASSWORD,
+            source_username=SOURCE_USERNAME,
+            source_password=SOURCE_PASSWORD,
+            scan_ids_for_downloading=SCAN_IDS_FOR_COPYING,
+            download_folder=download_folder,
+            batch_size=args.batch_size,
+            pack_tar=os.path.abspath(args.pack_tar) if args.pack_tar else None,
+        )
+    finally:
+        log_listener.stop()
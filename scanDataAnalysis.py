@@ -12,6 +12,141 @@ import os
 from datetime import datetime
 from config import *
 
+# Main query to get all scan details (one row per scan)
+SCAN_DATA_SQL = """
+SELECT 
+    s."id" as scan_id,
+    s."store_id",
+    s."created_at" as scan_created_at,
+    s."selected_category_id" as category_id,
+    cat."name" as category_name,
+
+    -- Realogram details
+    r."id" as realogram_id,
+    rb."id" as realogram_bay_id,
+
+    -- Store details
+    store."id" as store_id,
+    store."name" as store_name,
+
+    -- Planogram compliance report details
+    pcr."id" as compliance_report_id,
+    pcr."section_id",
+    pcr."section_name",
+    pcr."store_planogram_id",
+    pcr."planogram_id",
+    pcr."aisle_name",
+    pcr."compliance_rate" as pog_percentage,
+    pcr."facing_compliance_rate",
+    pcr."sequence_compliance_rate",
+    pcr."initial_pre_compliance",
+    pcr."compliance_rates" as compliance_rates_json,
+
+    -- Store planogram compliance (pre/post data)
+    spc."post_osa",
+    spc."pre_osa",
+    spc."post_compliance",
+    spc."pre_compliance",
+    spc."facing_compliance",
+    spc."sequence_post_compliance",
+    spc."sequence_pre_compliance",
+    spc."initial_pre_compliance" as spc_initial_pre_compliance,
+
+    -- Planogram details
+    p."id" as planogram_id,
+    p."name" as planogram_name,
+
+    -- Planogram counts for this scan
+    (SELECT COUNT(DISTINCT pcr2."planogram_id") 
+     FROM "planograms_compliance_planogramcompliancereport" pcr2
+     WHERE pcr2."realogram_id" = r."id") as planogram_unique_count,
+    (SELECT COUNT(pcr2."planogram_id") 
+     FROM "planograms_compliance_planogramcompliancereport" pcr2
+     WHERE pcr2."realogram_id" = r."id") as planogram_all_count,
+
+    -- Realogram counts for this scan
+    (SELECT COUNT(DISTINCT r2."id") 
+     FROM "realograms_implementation_realogram" r2
+     WHERE r2."id" = s."active_realogram_id") as realogram_unique_count,
+    (SELECT COUNT(r2."id") 
+     FROM "realograms_implementation_realogram" r2
+     WHERE r2."id" = s."active_realogram_id") as realogram_all_count,
+
+    -- Majority v2 logs data
+    mv2."id" as majority_v2_id,
+    mv2."store_planogram_id" as majority_store_planogram_id,
+    mv2."scan_created_date" as majority_created_at,
+    mv2."data" as majority_data
+
+FROM "realograms_implementation_scan" s
+
+-- Category
+LEFT JOIN "master_data_implementation_category" cat
+    ON s."selected_category_id" = cat."id"
+
+-- Realogram
+LEFT JOIN "realograms_implementation_realogram" r
+    ON s."active_realogram_id" = r."id"
+
+-- Realogram Bay
+LEFT JOIN "realograms_implementation_realogrambay" rb
+    ON r."id" = rb."realogram_id"
+
+-- Store
+LEFT JOIN "master_data_implementation_store" store
+    ON s."store_id" = store."id"
+
+-- Planogram compliance report
+LEFT JOIN "planograms_compliance_planogramcompliancereport" pcr
+    ON r."id" = pcr."realogram_id"
+
+-- Store planogram compliance (pre/post data)
+LEFT JOIN "planograms_compliance_storeplanogramcompliance" spc
+    ON pcr."store_planogram_id" = spc."store_planogram_id"
+    AND pcr."scan_created_date" = spc."date"
+
+-- Planogram
+LEFT JOIN "planograms_implementation_planogram" p
+    ON pcr."planogram_id" = p."id"
+
+-- Majority v2 logs (join on store_planogram_id, get the latest record)
+LEFT JOIN LATERAL (
+    SELECT mv2."id", mv2."store_planogram_id", mv2."scan_created_date", mv2."data"
+    FROM "planograms_compliance_majorityv2log" mv2
+    WHERE mv2."store_planogram_id" = pcr."store_planogram_id"
+    ORDER BY mv2."scan_created_date" DESC
+    LIMIT 1
+) mv2 ON true
+
+WHERE s."id" = ANY(%s)
+ORDER BY s."id";
+"""
+
+# Query to check for additional sections
+ADDITIONAL_SECTIONS_SQL = """
+SELECT DISTINCT
+    s."id" as scan_id,
+    pcr."section_id",
+    pcr."section_name",
+    CASE 
+        WHEN EXISTS (
+            SELECT 1 FROM "planograms_implementation_planogramstore" sp
+            JOIN "planograms_implementation_planogram" p ON sp."planogram_id" = p."id"
+            JOIN "planograms_implementation_planogramsection" ps ON p."id" = ps."planogram_id"
+            JOIN "planograms_implementation_planogramsectionproduct" psp ON ps."id" = psp."section_id"
+            WHERE sp."id" = pcr."store_planogram_id"
+            AND psp."section_id" = pcr."section_id"
+            AND (psp."action" ILIKE '%%additional%%' OR psp."merch_method" ILIKE '%%additional%%')
+        ) THEN true
+        ELSE false
+    END as is_additional_section
+FROM "realograms_implementation_scan" s
+LEFT JOIN "realograms_implementation_realogram" r ON s."active_realogram_id" = r."id"
+LEFT JOIN "planograms_compliance_planogramcompliancereport" pcr ON r."id" = pcr."realogram_id"
+WHERE s."id" = ANY(%s)
+ORDER BY s."id";
+"""
+
 def get_scan_data(instance_name: str, db_password: str, scan_ids: tuple):
     """Get complete scan data from all relevant tables"""
     
@@ -26,121 +161,8 @@ def get_scan_data(instance_name: str, db_password: str, scan_ids: tuple):
             row_factory=dict_row
     ) as connection:
         with connection.cursor() as cursor:
-            
-            scan_ids_str = ','.join(map(str, scan_ids))
-            
-            # Main query to get all scan details (one row per scan)
-            query = f"""
-                SELECT 
-                    s."id" as scan_id,
-                    s."store_id",
-                    s."created_at" as scan_created_at,
-                    s."selected_category_id" as category_id,
-                    cat."name" as category_name,
-                    
-                    -- Realogram details
-                    r."id" as realogram_id,
-                    rb."id" as realogram_bay_id,
-                    
-                    -- Store details
-                    store."id" as store_id,
-                    store."name" as store_name,
-                    
-                    -- Planogram compliance report details
-                    pcr."id" as compliance_report_id,
-                    pcr."section_id",
-                    pcr."section_name",
-                    pcr."store_planogram_id",
-                    pcr."planogram_id",
-                    pcr."aisle_name",
-                    pcr."compliance_rate" as pog_percentage,
-                    pcr."facing_compliance_rate",
-                    pcr."sequence_compliance_rate",
-                    pcr."initial_pre_compliance",
-                    pcr."compliance_rates" as compliance_rates_json,
-                    
-                    -- Store planogram compliance (pre/post data)
-                    spc."post_osa",
-                    spc."pre_osa",
-                    spc."post_compliance",
-                    spc."pre_compliance",
-                    spc."facing_compliance",
-                    spc."sequence_post_compliance",
-                    spc."sequence_pre_compliance",
-                    spc."initial_pre_compliance" as spc_initial_pre_compliance,
-                    
-                    -- Planogram details
-                    p."id" as planogram_id,
-                    p."name" as planogram_name,
-                    
-                    -- Planogram counts for this scan
-                    (SELECT COUNT(DISTINCT pcr2."planogram_id") 
-                     FROM "planograms_compliance_planogramcompliancereport" pcr2
-                     WHERE pcr2."realogram_id" = r."id") as planogram_unique_count,
-                    (SELECT COUNT(pcr2."planogram_id") 
-                     FROM "planograms_compliance_planogramcompliancereport" pcr2
-                     WHERE pcr2."realogram_id" = r."id") as planogram_all_count,
-                    
-                    -- Realogram counts for this scan
-                    (SELECT COUNT(DISTINCT r2."id") 
-                     FROM "realograms_implementation_realogram" r2
-                     WHERE r2."id" = s."active_realogram_id") as realogram_unique_count,
-                    (SELECT COUNT(r2."id") 
-                     FROM "realograms_implementation_realogram" r2
-                     WHERE r2."id" = s."active_realogram_id") as realogram_all_count,
-                    
-                    -- Majority v2 logs data
-                    mv2."id" as majority_v2_id,
-                    mv2."store_planogram_id" as majority_store_planogram_id,
-                    mv2."scan_created_date" as majority_created_at,
-                    mv2."data" as majority_data
-                    
-                FROM "realograms_implementation_scan" s
-                
-                -- Category
-                LEFT JOIN "master_data_implementation_category" cat
-                    ON s."selected_category_id" = cat."id"
-                
-                -- Realogram
-                LEFT JOIN "realograms_implementation_realogram" r
-                    ON s."active_realogram_id" = r."id"
-                
-                -- Realogram Bay
-                LEFT JOIN "realograms_implementation_realogrambay" rb
-                    ON r."id" = rb."realogram_id"
-                
-                -- Store
-                LEFT JOIN "master_data_implementation_store" store
-                    ON s."store_id" = store."id"
-                
-                -- Planogram compliance report
-                LEFT JOIN "planograms_compliance_planogramcompliancereport" pcr
-                    ON r."id" = pcr."realogram_id"
-                
-                -- Store planogram compliance (pre/post data)
-                LEFT JOIN "planograms_compliance_storeplanogramcompliance" spc
-                    ON pcr."store_planogram_id" = spc."store_planogram_id"
-                    AND pcr."scan_created_date" = spc."date"
-                
-                -- Planogram
-                LEFT JOIN "planograms_implementation_planogram" p
-                    ON pcr."planogram_id" = p."id"
-                
-                -- Majority v2 logs (join on store_planogram_id, get the latest record)
-                LEFT JOIN LATERAL (
-                    SELECT mv2."id", mv2."store_planogram_id", mv2."scan_created_date", mv2."data"
-                    FROM "planograms_compliance_majorityv2log" mv2
-                    WHERE mv2."store_planogram_id" = pcr."store_planogram_id"
-                    ORDER BY mv2."scan_created_date" DESC
-                    LIMIT 1
-                ) mv2 ON true
-                
-                WHERE s."id" IN ({scan_ids_str})
-                ORDER BY s."id";
-            """
-            
             print("Executing main query...")
-            cursor.execute(query)
+            cursor.execute(SCAN_DATA_SQL, (list(scan_ids),))
             results = cursor.fetchall()
             
             return results
@@ -157,37 +179,32 @@ def check_additional_sections(instance_name: str, db_password: str, scan_ids: tu
             row_factory=dict_row
     ) as connection:
         with connection.cursor() as cursor:
-            
-            scan_ids_str = ','.join(map(str, scan_ids))
-            
-            # Query to check for additional sections
-            query = f"""
-                SELECT DISTINCT
-                    s."id" as scan_id,
-                    pcr."section_id",
-                    pcr."section_name",
-                    CASE 
-                        WHEN EXISTS (
-                            SELECT 1 FROM "planograms_implementation_planogramstore" sp
-                            JOIN "planograms_implementation_planogram" p ON sp."planogram_id" = p."id"
-                            JOIN "planograms_implementation_planogramsection" ps ON p."id" = ps."planogram_id"
-                            JOIN "planograms_implementation_planogramsectionproduct" psp ON ps."id" = psp."section_id"
-                            WHERE sp."id" = pcr."store_planogram_id"
-                            AND psp."section_id" = pcr."section_id"
-                            AND (psp."action" ILIKE '%additional%' OR psp."merch_method" ILIKE '%additional%')
-                        ) THEN true
-                        ELSE false
-                    END as is_additional_section
-                FROM "realograms_implementation_scan" s
-                LEFT JOIN "realograms_implementation_realogram" r ON s."active_realogram_id" = r."id"
-                LEFT JOIN "planograms_compliance_planogramcompliancereport" pcr ON r."id" = pcr."realogram_id"
-                WHERE s."id" IN ({scan_ids_str})
-                ORDER BY s."id";
-            """
-            
-            cursor.execute(query)
+            cursor.execute(ADDITIONAL_SECTIONS_SQL, (list(scan_ids),))
             return cursor.fetchall()
 
+def get_scan_data_with_sections(instance_name: str, db_password: str, scan_ids: tuple):
+    """Get scan data and additional section flags over a single connection.
+    Both queries are sent in one pipeline, so they cost one round trip instead of two connections."""
+    
+    print(f"Getting scan data from {instance_name}...")
+    
+    params = (list(scan_ids),)
+    with psycopg.connect(
+            user='proxyuser',
+            password=db_password,
+            host=f'{instance_name}-maint.rebotics.net',
+            port='5432',
+            dbname=instance_name,
+            row_factory=dict_row
+    ) as connection:
+        with connection.cursor() as scan_cursor, connection.cursor() as sections_cursor:
+            print("Executing main query...")
+            with connection.pipeline():
+                scan_cursor.execute(SCAN_DATA_SQL, params)
+                sections_cursor.execute(ADDITIONAL_SECTIONS_SQL, params)
+            
+            return scan_cursor.fetchall(), sections_cursor.fetchall()
+
 def process_scan_data(scan_data, additional_sections_data):
     """Process and structure the scan data"""
     
@@ -410,12 +427,8 @@ def main():
     try:
         # Get source data
         print(f"\n{'='*20} SOURCE DATABASE ({SOURCE_INSTANCE}) {'='*20}")
-        source_data = get_scan_data(SOURCE_INSTANCE, SOURCE_DB_PASSWORD, SCAN_IDS_FOR_COPYING)
+        source_data, additional_sections_data = get_scan_data_with_sections(SOURCE_INSTANCE, SOURCE_DB_PASSWORD, SCAN_IDS_FOR_COPYING)
         print(f"Retrieved {len(source_data)} records from source database")
-        
-        # Check for additional sections
-        print("Checking for additional sections...")
-        additional_sections_data = check_additional_sections(SOURCE_INSTANCE, SOURCE_DB_PASSWORD, SCAN_IDS_FOR_COPYING)
         print(f"Retrieved {len(additional_sections_data)} additional section records")
         
         # Process data